@@ -8,16 +8,16 @@ __license__ = "ISC license"
 __email__ = "seidlmayer@zbmed.de"
 __version__ = "1 "
 
-import requests
-import logger
-import pysolr
+import argparse
+import json
 
+import pandas as pd
 
-solr = pysolr.Solr('http://134.95.56.177:8080/solr/default/')
-print(solr.ping())  
+from from_qgraph.fetching import make_session
+from from_qgraph.solr import KE_SOLR_URL, or_query, solr_quote, solr_select
 
 
-# checks for amount of publications in the dataset related to specific MeSH terms 
+# checks for amount of publications in the dataset related to specific MeSH terms
 terms = ['Ebolavirus',
          'Betacoronavirus',
          'Zika Virus',
@@ -30,34 +30,98 @@ terms = ['Ebolavirus',
          'Marburgvirus']
 
 years=['1994', '1993', '1992', '1991', '1990', '1989', '1988', '1987', '1986', '1985']
-for year in years:
-    for term in terms:
-        number = solr.search('MESH:"{}" AND PUBLYEAR:"{}"'.format(term,year)).hits
-        print(f'{year}{term}:', number)
-    
 
 
+def count_cells(session, solr_url, terms, years):
+    """ One query per term and year """
+    counts = []
+    for year in years:
+        for term in terms:
+            response = solr_select(session, solr_url, {
+                'q': 'MESH:{} AND PUBLYEAR:{}'.format(solr_quote(term), solr_quote(year)),
+                'rows': 0
+            })
+            number = response['response']['numFound']
+            print(f'{year}{term}:', number)
+            counts.append((term, year, number))
+    return pd.DataFrame(counts, columns=['mesh', 'year', 'count'])
 
-# requests for Zika Virus in publication year 2002  
-string ='http://134.95.56.177:8080/solr/default/select?q=MESH%3A%5B*+TO+*%5D+Zika+Virus%0APUBLYEAR%3A%5B*+TO+*%5D+2002&wt=json&indent=true'
-r = requests.get(string)
-print(r)
-a=r.json()
-print(a)
 
+def count_facets(session, solr_url, terms, years=None, terms_per_request=100):
+    """ Counts per term and year from JSON facet requests with one query
+    facet per term (`terms_per_request` per request), each with a PUBLYEAR
+    terms sub-facet, restricted to `years` if given """
+    counts = []
+    for start in range(0, len(terms), terms_per_request):
+        chunk = terms[start:start + terms_per_request]
+        facets = {
+            f'term{i}': {
+                'type': 'query',
+                'q': 'MESH:{}'.format(solr_quote(term)),
+                'facet': {'years': {'type': 'terms', 'field': 'PUBLYEAR',
+                                    'limit': -1, 'mincount': 1}}
+            } for i, term in enumerate(chunk)
+        }
+        params = {'q': '*:*', 'rows': 0, 'json.facet': json.dumps(facets)}
+        if years:
+            params['fq'] = or_query('PUBLYEAR', years)
+        response = solr_select(session, solr_url, params)
+        for i, term in enumerate(chunk):
+            term_facet = response['facets'].get(f'term{i}', {})
+            for year_facet in term_facet.get('years', {}).get('buckets', []):
+                counts.append((term, str(year_facet['val']), year_facet['count']))
+    df = pd.DataFrame(counts, columns=['mesh', 'year', 'count'])
+    if years:
+        # Include cells without publications
+        cells = pd.MultiIndex.from_product([terms, years], names=['mesh', 'year'])
+        df = df.set_index(['mesh', 'year']).reindex(cells, fill_value=0).reset_index()
+    return df
 
-# requests for a specific DOI
-r = requests.get('http://134.95.56.177:8080/solr/default/select?wt=json&q=DOI:10.1364/OE.20.000816')
-print(r.url)
-print(dir(r))
-b=r.json()
-print(b)
 
+def main():
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument('--solr-url', default=KE_SOLR_URL,
+                        help="Base url of the Solr core")
+    parser.add_argument('--mode', choices=['facets', 'cells'], default='facets',
+                        help="facets: one facet request per 100 terms, cells: one request per cell")
+    parser.add_argument('--terms-file', default=None,
+                        help="MeSH terms to count, one per line (default: built-in list)")
+    parser.add_argument('--years', default=None, nargs='+',
+                        help="Years to count, e.g. 1985 1986 or a range 1985-1994 "
+                        "(default: built-in list, 'all' for all years in facets mode)")
+    parser.add_argument('-o', '--output', default=None,
+                        help="Write tidy csv (mesh, year, count) to this file")
+    args = parser.parse_args()
 
-# requests for a bunch of DOI coming from a csv
-reference_to = pd.read_csv('')
-for doi in dois:
-    r = requests.get(f'http://134.95.56.177:8080/solr/default/select?wt=json&q=DOI:{doi}')
-    reference = r.json()
-    print(reference)
+    count_terms = terms
+    if args.terms_file:
+        with open(args.terms_file, 'r') as fhandle:
+            count_terms = [line.strip() for line in fhandle if line.strip()]
+    count_years = years
+    if args.years == ['all']:
+        count_years = None
+    elif args.years:
+        count_years = []
+        for year in args.years:
+            if '-' in year:
+                first, last = year.split('-')
+                count_years.extend(str(y) for y in range(int(first), int(last) + 1))
+            else:
+                count_years.append(year)
 
+    session = make_session()
+    if args.mode == 'cells':
+        if count_years is None:
+            parser.error("--years all requires --mode facets")
+        df = count_cells(session, args.solr_url, count_terms, count_years)
+    else:
+        df = count_facets(session, args.solr_url, count_terms, count_years)
+
+    if args.output:
+        df.to_csv(args.output, index=False)
+    else:
+        print(df.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
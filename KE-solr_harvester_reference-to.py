@@ -8,72 +8,115 @@ __license__ = "ISC license"
 __email__ = "seidlmayer@zbmed.de"
 __version__ = "1 "
 
-import requests
 import argparse
 import csv
-from pandas import read_csv
-
-
-
-# harvest Knowldge Environment via Solr for referenced MESH-terms
-def check_referenced_mesh(line, csv_writer):
-    reference = line
-
-#def check_referenced_mesh(row, csv_writer):
-    #reference = row['reference_to_doi']
-    r = requests.get(f'http://134.95.56.177:8080/solr/default/select?wt=json&q=DOI:{reference}')
-    reference = r.json()
-    print(reference)
-    #print(reference['response']['docs'][0]['MESH'])
-    year = reference['response']['docs'][0]['PUBLYEAR']
-    date = reference['response']['docs'][0]['PUBLDATE']
-    title = reference['response']['docs'][0]['TITLE']
-    #referenced_mesh = reference['response']['docs'][0]['MESH']
-    #for term in referenced_mesh:
-
-        #infos = row['doi'], row['reference_to_doi'], term
-    infos = line, title, year, date
-    print(infos)
-    csv_writer.writerow(infos)
-
-
+from pandas import DataFrame, read_csv
+from tqdm import tqdm
+
+from from_qgraph.fetching import make_session, map_ordered
+from from_qgraph.solr import KE_SOLR_URL, first_value, or_query, solr_select
+
+FIELDS = ['DOI', 'TITLE', 'PUBLYEAR', 'PUBLDATE', 'MESH']
+
+
+def batches(values, batch_size):
+    for start in range(0, len(values), batch_size):
+        yield values[start:start + batch_size]
+
+
+def select_all(session, solr_url, params, page_size=1000):
+    """ All docs matching a query, requested in pages of `page_size` """
+    docs = []
+    while True:
+        response = solr_select(session, solr_url, {**params, 'start': len(docs), 'rows': page_size})
+        page = response['response']['docs']
+        docs.extend(page)
+        if not page or len(docs) >= response['response']['numFound']:
+            return docs
+
+
+def match_references(references, docs):
+    """ One row (paper_id, title, year, publ_date, mesh) per matched DOI """
+    # DOIs are case-insensitive, keep the first doc per DOI like docs[0] before.
+    # A doc may match through any value of a multi-valued DOI field.
+    by_doi = {}
+    for doc in docs:
+        dois = doc.get('DOI') or []
+        for doi in dois if isinstance(dois, list) else [dois]:
+            if doi:
+                by_doi.setdefault(doi.lower(), doc)
+    rows = []
+    for reference in references:
+        doc = by_doi.get(reference.lower())
+        if doc is None:
+            continue
+        mesh = doc.get('MESH') or []
+        rows.append((reference, first_value(doc.get('TITLE')), first_value(doc.get('PUBLYEAR')),
+                     first_value(doc.get('PUBLDATE')),
+                     ';'.join(mesh) if isinstance(mesh, list) else mesh))
+    return rows
+
+
+# harvest Knowledge Environment via Solr for a batch of referenced DOIs
+def lookup_references(session, solr_url, references, page_size=1000):
+    """ Returns the rows of the matched DOIs and the DOIs whose lookup failed.
+    A failing batch is split in halves, so only the failing DOIs are lost. """
+    try:
+        docs = select_all(session, solr_url, {
+            'q': or_query('DOI', references),
+            'fl': ','.join(FIELDS)
+        }, page_size=page_size)
+    except Exception as e:
+        if len(references) == 1:
+            print('Exception', references[0], e)
+            return [], list(references)
+        half = len(references) // 2
+        rows, failed = lookup_references(session, solr_url, references[:half], page_size)
+        more_rows, more_failed = lookup_references(session, solr_url, references[half:], page_size)
+        return rows + more_rows, failed + more_failed
+    return match_references(references, docs), []
 
 
 def main():
     parser = argparse.ArgumentParser(description=__description__)
     parser.add_argument('input_file_csv') # needs to contain the DOIs for requesting references
     parser.add_argument('output_file_csv')
+    parser.add_argument('--solr-url', default=KE_SOLR_URL,
+                        help="Base url of the Solr core")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="Number of DOIs per request")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Number of concurrent requests")
     args = parser.parse_args()
 
 # creates different output files
     with open(args.output_file_csv, 'a') as csvfile:
         csv_writer = csv.writer(csvfile)
-        #csv_writer.writerow(['paper_id', 'reference_to_doi', 'reference_to_MESH-terms'])
-        #csv_writer.writerow(['reference_to_doi', 'reference_to_MESH-terms'])
-        csv_writer.writerow(['paper_id', 'title','year','publ_date'])
-
+        csv_writer.writerow(['paper_id', 'title', 'year', 'publ_date', 'mesh'])
 
 # harvest input reference DOI
         input = read_csv(args.input_file_csv)
         input = input['reference_to_doi']
-        input = input.drop_duplicates()
-        for line in input:
-            try:
-                if line:
-                #print(line)
-                    check_referenced_mesh(line, csv_writer)
-            except Exception as e:
-                print('Exception', e)
-     
-        '''
-        for index, row in input.iterrows():
-            try:
-                if row['reference_to_doi']:
-                    #print('main', row['doi'], row['reference_to_doi'])
-                    check_referenced_mesh(row, csv_writer)
-
-            except Exception as e:
-                print ('Exception', e)
-        '''
-
-main()
+        input = input.drop_duplicates().dropna()
+        references = [line for line in input if line]
+
+        session = make_session(pool_size=args.workers)
+        results = map_ordered(lambda batch: lookup_references(session, args.solr_url, batch),
+                              batches(references, args.batch_size), n_workers=args.workers)
+        n_matched = 0
+        failed = []
+        for rows, batch_failed in tqdm(results, total=-(-len(references) // args.batch_size)):
+            csv_writer.writerows(rows)
+            n_matched += len(rows)
+            failed.extend(batch_failed)
+        print(f"Matched {n_matched} of {len(references)} DOIs")
+
+    if failed:
+        # Same format as the input, to rerun only these
+        failed_file = args.output_file_csv + '.failed.csv'
+        DataFrame({'reference_to_doi': failed}).to_csv(failed_file, index=False)
+        print(f"Lookup failed for {len(failed)} DOIs, written to '{failed_file}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
-import xmltodict
 from collections import Counter
 
+from joblib import Parallel, delayed
+
+from from_qgraph.sketches import ApproximateCounter
+from from_qgraph.sru import SRUFormatError, iter_sru_records, doc_fields, doc_keys
+
 """
 SCHEMA:
 {'VERFASSERANG', 'classification', 'bibkey', 'MedlineTANorm', 'TITLETRANSLAT',
@@ -21,85 +25,149 @@ SCHEMA:
 """
 
 
+ntom_fields = ['classification', 'MESH', 'AUTHOR', 'KEYWORDS']
+nto1_fields = ['SOURCE', 'LANGUAGE', 'DOCTYPE', 'DBDOCTYPE', 'sortyear']
+fields = ntom_fields + nto1_fields
+
+# Fields needed to apply the filters, checked before materializing others
+filter_fields = ('sortyear', 'LANGUAGE', 'MESH')
+
+
 def split_field(raw_string):
     return [t.strip() for t in raw_string.split(';')]
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("infile", nargs='+')
-parser.add_argument("--mesh", help='Consider only mesh-annotated docs',
-                    default=False, action='store_true')
-parser.add_argument("--recent", help='Consider only 2020 records',
-                    default=False, action='store_true')
-parser.add_argument("--english", help='Consider only English records',
-                    default=False, action='store_true')
-args = parser.parse_args()
+def make_counters(approximate=False, top_k=1000):
+    """ Counters per field, with `approximate` bounded-memory sketches
+    for the high-cardinality (n to m) fields """
+    counters = {k: Counter() for k in fields}
+    if approximate:
+        counters.update({k: ApproximateCounter(top_k) for k in ntom_fields})
+    return counters
 
-schema = set()
 
+def num_labels(counter):
+    if isinstance(counter, ApproximateCounter):
+        return counter.total()
+    return sum(counter.values())
 
-ntom_fields = ['classification', 'MESH', 'AUTHOR', 'KEYWORDS']
-nto1_fields = ['SOURCE', 'LANGUAGE', 'DOCTYPE', 'DBDOCTYPE', 'sortyear']
-fields = ntom_fields + nto1_fields
 
-counters = {k: Counter() for k in fields}
+def analyze_file(infile, mesh=False, recent=False, english=False, approximate=False, top_k=1000):
+    """ Collect schema, counters, and record numbers of a single SRU response file """
+    schema = set()
+    counters = make_counters(approximate, top_k)
+    num_records, num_valid = 0, 0
+    num_valid_has_mesh, num_valid_has_keywords = 0, 0
 
-num_records, num_valid = 0, 0
-num_valid_has_mesh, num_valid_has_keywords = 0, 0
-for infile in args.infile:
     print("Processing", infile)
-    with open(infile, 'r') as xmlfile:
-        records = xmltodict.parse(xmlfile.read())['zs:searchRetrieveResponse']\
-            ['zs:records']
-
-    for record in records['zs:record']:
-        num_records += 1
-        try:
-            obj = record['zs:recordData']['doc']
-        except KeyError:
-            continue
-        if args.recent:
-            if 'sortyear' not in obj:
-                continue
-            if int(obj['sortyear']) != 2020:
-                continue
-
-        if args.english:
-            if 'LANGUAGE' not in obj:
+    try:
+        for doc in iter_sru_records(infile):
+            num_records += 1
+            if doc is None:
                 continue
-            if obj['LANGUAGE'] != 'eng':
+            obj = doc_fields(doc, filter_fields)
+            if recent:
+                if 'sortyear' not in obj:
+                    continue
+                if int(obj['sortyear']) != 2020:
+                    continue
+
+            if english:
+                if 'LANGUAGE' not in obj:
+                    continue
+                if obj['LANGUAGE'] != 'eng':
+                    continue
+
+            if mesh and 'MESH' not in obj:
                 continue
 
-        if args.mesh and 'MESH' not in obj:
-            continue
-
-        num_valid += 1
-        if 'MESH' in obj:
-            num_valid_has_mesh += 1
-        if 'KEYWORDS' in obj:
-            num_valid_has_keywords += 1
-        schema |= set(obj.keys())
-
-        for field in ntom_fields:
-            if field in obj:
-                counters[field].update(split_field(obj[field]))
-        for field in nto1_fields:
-            if field in obj:
-                counters[field].update([obj[field]])
-
-print("Schema:", schema, sep='\n')
-print("Num         records", num_records)
-print("Num   valid records", num_valid)
-print("Num invalid records", num_records - num_valid)
-print("Num valid with mesh:", num_valid_has_mesh)
-print("Num valid with keywords:", num_valid_has_keywords)
-for attribute, counter in counters.items():
-    print("-" * 78)
-    print("##", attribute)
-    print("Num Classes:", len(counter))
-    print("Num Labels:", sum(counter.values()))
-    print("20 most common:", *counter.most_common(20), sep='\n\t')
-    print("-" * 78)
-
-print("ALL KEYWORDS:")
-print(*counters['KEYWORDS'].most_common(), sep='\n\t')
+            num_valid += 1
+            keys = doc_keys(doc)
+            if 'MESH' in keys:
+                num_valid_has_mesh += 1
+            if 'KEYWORDS' in keys:
+                num_valid_has_keywords += 1
+            schema |= set(keys)
+
+            obj = doc_fields(doc, fields)
+            for field in ntom_fields:
+                if obj.get(field):
+                    counters[field].update(split_field(obj[field]))
+            for field in nto1_fields:
+                if field in obj:
+                    counters[field].update([obj[field]])
+    except SRUFormatError:
+        print(f"[skipping] '{infile}' does not match expected format, no 'searchRetrieveResponse'")
+
+    return {
+        'schema': schema,
+        'counters': counters,
+        'num_records': num_records,
+        'num_valid': num_valid,
+        'num_valid_has_mesh': num_valid_has_mesh,
+        'num_valid_has_keywords': num_valid_has_keywords
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("infile", nargs='+')
+    parser.add_argument("--mesh", help='Consider only mesh-annotated docs',
+                        default=False, action='store_true')
+    parser.add_argument("--recent", help='Consider only 2020 records',
+                        default=False, action='store_true')
+    parser.add_argument("--english", help='Consider only English records',
+                        default=False, action='store_true')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="How many parallel processes to use for parsing files")
+    parser.add_argument("--approximate", default=False, action='store_true',
+                        help="Count " + ", ".join(ntom_fields) + " with bounded memory: "
+                        "approximate top values (Space-Saving) and number of classes (HyperLogLog)")
+    parser.add_argument("--top-k", type=int, default=1000,
+                        help="Number of top values kept per field with --approximate")
+    args = parser.parse_args()
+
+    schema = set()
+    counters = make_counters(args.approximate, args.top_k)
+    num_records, num_valid = 0, 0
+    num_valid_has_mesh, num_valid_has_keywords = 0, 0
+    # Merge the per-file results as they arrive
+    all_stats = Parallel(n_jobs=args.jobs, return_as='generator')(
+        delayed(analyze_file)(infile, mesh=args.mesh, recent=args.recent, english=args.english,
+                              approximate=args.approximate, top_k=args.top_k)
+        for infile in args.infile)
+    for stats in all_stats:
+        schema |= stats['schema']
+        for field, counter in stats['counters'].items():
+            counters[field].update(counter)
+        num_records += stats['num_records']
+        num_valid += stats['num_valid']
+        num_valid_has_mesh += stats['num_valid_has_mesh']
+        num_valid_has_keywords += stats['num_valid_has_keywords']
+
+    print("Schema:", schema, sep='\n')
+    print("Num         records", num_records)
+    print("Num   valid records", num_valid)
+    print("Num invalid records", num_records - num_valid)
+    print("Num valid with mesh:", num_valid_has_mesh)
+    print("Num valid with keywords:", num_valid_has_keywords)
+    for attribute, counter in counters.items():
+        print("-" * 78)
+        print("##", attribute)
+        if isinstance(counter, ApproximateCounter):
+            print("Num Classes:", len(counter), "(approximate)")
+        else:
+            print("Num Classes:", len(counter))
+        print("Num Labels:", num_labels(counter))
+        print("20 most common:", *counter.most_common(20), sep='\n\t')
+        print("-" * 78)
+
+    if args.approximate:
+        print(f"TOP {args.top_k} KEYWORDS (approximate counts):")
+    else:
+        print("ALL KEYWORDS:")
+    print(*counters['KEYWORDS'].most_common(), sep='\n\t')
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,12 @@ This script combines the data for:
 
 """
 import argparse
+import numpy as np
 import pandas as pd
 import os
 
+from from_qgraph.utils import strip_qualifier_column
+
 def tee(*args, file=None):
     """Print to stdout and append to file (if not None)"""
     print(*args)
@@ -121,8 +124,62 @@ def ensure_min_count_constraint(df: pd.DataFrame, col: str, threshold: int, inpl
         return df.drop(invalid_rows)
     df.drop(invalid_rows, inplace=True)
 
-def strip_qualifier(s):
-    return s if '/' not in s else s[:s.index('/')]
+def to_csr(row_codes, col_codes, shape):
+    """ Build CSR arrays (indptr, indices) from parallel arrays of row/col codes.
+    Duplicate (row, col) pairs are stored once, indices are sorted within rows. """
+    n_rows, n_cols = shape
+    row_codes = np.asarray(row_codes, dtype=np.int64)
+    col_codes = np.asarray(col_codes, dtype=np.int64)
+    keys = np.unique(row_codes * n_cols + col_codes)
+    row_codes, col_codes = np.divmod(keys, n_cols)
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_codes, minlength=n_rows), out=indptr[1:])
+    return indptr, col_codes
+
+
+def save_csr(path, row_codes, col_codes, shape):
+    """ Save relation as CSR adjacency in an (uncompressed) .npz file.
+    Members are stored uncompressed, so they can be memory-mapped at their
+    offsets inside the archive. """
+    indptr, indices = to_csr(row_codes, col_codes, shape)
+    np.savez(path, indptr=indptr, indices=indices, shape=np.asarray(shape, dtype=np.int64))
+
+
+def save_vocab(path, values):
+    """ Write one identifier per line, line number equals integer id """
+    with open(path, 'w') as fhandle:
+        for value in values:
+            print(value, file=fhandle)
+
+
+def export_csr(output, df_paper, df_annotation=None, df_author=None, df_refs=None):
+    """ Export paper-subject, paper-author and citation relations as CSR
+    adjacency arrays along with the ID vocabularies (one id per line). """
+    papers = df_paper.index
+    save_vocab(os.path.join(output, "vocab_paper.txt"), papers)
+
+    if df_annotation is not None:
+        rows = papers.get_indexer(df_annotation.paper_id)
+        cols, subjects = pd.factorize(df_annotation.subject, sort=True)
+        valid = rows >= 0
+        save_vocab(os.path.join(output, "vocab_subject.txt"), subjects)
+        save_csr(os.path.join(output, "csr_paper_subject.npz"), rows[valid], cols[valid],
+                 (len(papers), len(subjects)))
+
+    if df_author is not None:
+        rows = papers.get_indexer(df_author.paper_id)
+        cols, authors = pd.factorize(df_author.author, sort=True)
+        valid = rows >= 0
+        save_vocab(os.path.join(output, "vocab_author.txt"), authors)
+        save_csr(os.path.join(output, "csr_paper_author.npz"), rows[valid], cols[valid],
+                 (len(papers), len(authors)))
+
+    if df_refs is not None:
+        rows = papers.get_indexer(df_refs.citing)
+        cols = papers.get_indexer(df_refs.cited)
+        valid = (rows >= 0) & (cols >= 0)
+        save_csr(os.path.join(output, "csr_citation.npz"), rows[valid], cols[valid],
+                 (len(papers), len(papers)))
 
 
 def load_dataframes(list_of_paths, **kwargs):
@@ -161,6 +218,8 @@ def main():
 
     # OUTPUT
     parser.add_argument('-o', '--output', default=None, help="Write assembled dataset to this path.")
+    parser.add_argument('--export_csr', default=False, action='store_true',
+                        help="Additionally write relations as CSR arrays (.npz) with ID vocabularies.")
 
     args = parser.parse_args()
     assert len(args.paper_data) == len(args.paper_data_sources), "Same number of paper data, and their source identifiers"
@@ -214,7 +273,7 @@ def main():
             track(df_annotation)
             df_annotation.drop_duplicates(keep="first", inplace=True)
         with TrackChanges(df_annotation, desc="Remove qualifier terms", logfile=logfile):
-            df_annotation.subject = df_annotation.subject.map(strip_qualifier)
+            df_annotation.subject = strip_qualifier_column(df_annotation.subject)
         with TrackChanges(df_annotation, desc="Ref. Int. (annotations -> papers)", logfile=logfile):
             ensure_referential_integrity(df_annotation, df_paper, inplace=True, left_col='paper_id')
 
@@ -279,6 +338,12 @@ def main():
     df_author.to_csv(os.path.join(args.output, "authorship.csv"), index=False)
     df_annotation.to_csv(os.path.join(args.output, "annotation.csv"), index=False)
     df_refs.to_csv(os.path.join(args.output, "references.csv"), index=False)
+    if args.export_csr:
+        print("Exporting CSR arrays to", args.output)
+        export_csr(args.output, df_paper,
+                   df_annotation=df_annotation if args.annotation_data else None,
+                   df_author=df_author if args.author_data else None,
+                   df_refs=df_refs if args.reference_data else None)
     print("Done.")
 
     tee("Value counts for annotations", file=logfile)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark from_qgraph/harvest_mesh.py: streaming N-Triples extraction vs.
+loading the full rdflib Graph, on a synthetic file in the layout of mesh.nt.
+Checks that both engines find the same broader relationships.
+
+    python3 benchmarks/bench_harvest_mesh.py -n 20000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'from_qgraph'))
+from harvest_mesh import (BROADER_DESCRIPTOR, RDFS_LABEL,  # noqa: E402
+                          extract_broader_rdflib, extract_broader_stream)
+
+MESH = "http://id.nlm.nih.gov/mesh/"
+MESHV = "http://id.nlm.nih.gov/mesh/vocab#"
+
+
+def write_mesh_nt(path, n_descriptors):
+    """ Descriptors with labels, tree numbers, concepts and terms, such that
+    only a small fraction of all triples are labels or broader relations """
+    random.seed(0)
+    with open(path, 'w', encoding='utf-8') as fhandle:
+        def triple(s, p, o):
+            fhandle.write(f'<{s}> <{p}> {o} .\n')
+
+        for i in range(n_descriptors):
+            desc = f'{MESH}D{i:06d}'
+            label = f'Descriptor \\"{i}\\" \\u00e9' if i % 97 == 0 else f'Descriptor {i}'
+            triple(desc, RDFS_LABEL, f'"{label}"@en')
+            triple(desc, MESHV + 'identifier', f'"D{i:06d}"')
+            triple(desc, 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type', f'<{MESHV}TopicalDescriptor>')
+            triple(desc, MESHV + 'dateCreated',
+                   '"2000-01-01"^^<http://www.w3.org/2001/XMLSchema#date>')
+            for j in range(3):
+                concept = f'{MESH}M{i:06d}{j}'
+                triple(desc, MESHV + 'concept', f'<{concept}>')
+                triple(concept, RDFS_LABEL, f'"Concept {i} {j}"@en')
+                for k in range(3):
+                    term = f'{MESH}T{i:06d}{j}{k}'
+                    triple(concept, MESHV + 'term', f'<{term}>')
+                    triple(term, MESHV + 'prefLabel', f'"Term {i} {j} {k}"@en')
+            if i > 0:
+                for parent in random.sample(range(i), min(i, random.randint(1, 3))):
+                    triple(desc, BROADER_DESCRIPTOR, f'<{MESH}D{parent:06d}>')
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--descriptors', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'mesh.nt')
+        write_mesh_nt(path, args.descriptors)
+        print("File size: %.1f MB" % (os.path.getsize(path) / 1e6))
+
+        stream, t_stream, m_stream = measure(extract_broader_stream, path)
+        try:
+            import rdflib  # noqa: F401
+        except ImportError:
+            print("stream: %.2fs, peak %.1f MB (rdflib not installed)" % (t_stream, m_stream / 1e6))
+            return
+        graph, t_graph, m_graph = measure(extract_broader_rdflib, path)
+
+    # Triple order of the rdflib Graph is arbitrary, compare as sets
+    assert {k: sorted(v) for k, v in stream.items()} == {k: sorted(v) for k, v in graph.items()}
+    print("rdflib: %.2fs, peak %.1f MB" % (t_graph, m_graph / 1e6))
+    print("stream: %.2fs, peak %.1f MB (%.1fx faster)" % (t_stream, m_stream / 1e6, t_graph / t_stream))
+
+
+if __name__ == '__main__':
+    main()
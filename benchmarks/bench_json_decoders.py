@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark JSON lines decoding across the input formats of all JSONL harvesters:
+jsonlines with the stdlib json module (previous reader) vs.
+from_qgraph/jsonl_reader.iter_jsonl with each available decoder.
+
+    python3 benchmarks/bench_json_decoders.py -n 100000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from from_qgraph.jsonl_reader import JSON_DECODERS, get_decoder, iter_jsonl  # noqa: E402
+
+MESH = ['Humans', 'Animals', 'COVID-19', 'Pneumonia, Viral/epidemiology',
+        'Betacoronavirus/genetics', 'Coronavirus Infections/diagnosis']
+
+
+def livivo_record(i):
+    """ harvest_livivo.py, harvest_doi_mesh_abstract_from_zbmed_jsonl.py """
+    return {'_id': {'$oid': f'{i:024x}'},
+            'liv': {'orig_data': {
+                'DBRECORDID': f'M{i}', 'DOI': [f'10.1000/{i}'], 'sortyear': ['2020'],
+                'TITLE': [f'Title of paper {i}'], 'LANGUAGE': ['eng'],
+                'ABSTRACT': [' '.join(['lorem ipsum dolor sit amet'] * 40)],
+                'AUTHOR': [f'Author {j}' for j in range(5)],
+                'MESH': random.sample(MESH, 4), 'SOURCE': ['Journal']}}}
+
+
+def econbiz_record(i):
+    """ harvest_econbiz.py """
+    return {'econbiz_id': f'10{i}', 'title': f'Title of paper {i}', 'date': '2020',
+            'language': ['eng'], 'creator_personal': [{'name': f'Author {j}'} for j in range(3)],
+            'subject_stw': [{'stw_id': f'{j}-{i % 7}', 'name': 'Subject'} for j in range(4)]}
+
+
+def preprint_record(i):
+    """ harvest_preprints_jsonl.py """
+    return {'id': f'10.1101/{i}', 'date': '2020-05-01', 'title': f'Title of preprint {i}',
+            'abstract': ' '.join(['lorem ipsum dolor sit amet'] * 40),
+            'ents': [{'concept': f'http://id.nlm.nih.gov/mesh/D{j:06d}', 'start': j, 'end': j + 5}
+                     for j in range(10)]}
+
+
+def crossref_record(i):
+    """ crossref-harvesting*.py """
+    return {'status': 'ok', 'message': {
+        'DOI': f'10.1000/{i}', 'title': [f'Title of paper {i}'], 'ISSN': ['1234-5678'],
+        'published-online': {'date-parts': [[2020, 5, 1]]},
+        'author': [{'given': 'A', 'family': f'Author {j}', 'ORCID': 'http://orcid.org/0000-0000'}
+                   for j in range(5)],
+        'reference': [{'key': f'ref{j}', 'DOI': f'10.1000/{j}', 'journal-title': 'J'}
+                      for j in range(30)]}}
+
+
+FORMATS = [('livivo', livivo_record), ('econbiz', econbiz_record),
+           ('preprints', preprint_record), ('crossref', crossref_record)]
+
+
+def timed(fn):
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    gc.enable()
+    return seconds, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num-records', type=int, default=100000)
+    args = parser.parse_args()
+    random.seed(42)
+
+    decoders = []
+    for name in JSON_DECODERS[1:]:
+        try:
+            get_decoder(name)
+            decoders.append(name)
+        except ImportError:
+            print(f"Decoder '{name}' not installed, skipping.")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for fmt, make_record in FORMATS:
+            path = os.path.join(tmpdir, fmt + '.jsonl')
+            with open(path, 'w') as fhandle:
+                for i in range(args.num_records):
+                    print(json.dumps(make_record(i), ensure_ascii=False), file=fhandle)
+            print(f"## {fmt} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+
+            try:
+                import jsonlines
+                baseline, expected = timed(lambda: list(jsonlines.open(path, loads=json.loads)))
+                print(f"\tjsonlines + stdlib json: {baseline:.2f}s")
+            except ImportError:
+                baseline, expected = None, None
+
+            for name in decoders:
+                seconds, result = timed(lambda: list(iter_jsonl(path, decoder=name)))
+                if expected is not None:
+                    assert result == expected, f"Decoder '{name}' gives different results"
+                speedup = f" ({baseline / seconds:.1f}x)" if baseline else ""
+                print(f"\t{name}: {seconds:.2f}s{speedup}")
+
+
+if __name__ == '__main__':
+    main()
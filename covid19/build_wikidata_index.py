@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__description__ = "Build a local index of DOIs, authors and employers from a Wikidata truthy dump "
+__author__ = "Eva Seidlmayer <eva.seidlmayer@gmx.net>"
+__copyright__ = "2020 by Eva Seidlmayer"
+__license__ = "ISC license"
+__email__ = "seidlmayer@zbmed.de"
+__version__ = "1 "
+
+"""
+Streams a Wikidata truthy N-Triples dump (latest-truthy.nt.gz/.bz2, or '-' for
+stdin, e.g. from `lbzip2 -dc`) once and keeps only DOI (P356), author (P50)
+and employer (P108) statements and the labels of the employers. The result
+is a sqlite file with the tables
+    doi_items         doi (upper case), item
+    item_authors      item, author
+    author_employers  author, employer
+    labels            item, label
+which harvest_covid19_Wikidata.py --offline answers all lookups from.
+
+    python3 covid19/build_wikidata_index.py latest-truthy.nt.gz wikidata_index.db --dois covid_dois.txt
+"""
+
+import argparse
+import bz2
+import gzip
+import os
+import re
+import sqlite3
+import sys
+
+from tqdm import tqdm
+
+ENTITY = "http://www.wikidata.org/entity/"
+DIRECT = "http://www.wikidata.org/prop/direct/"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+DOI, AUTHOR, EMPLOYER = DIRECT + "P356", DIRECT + "P50", DIRECT + "P108"
+TABLES = {
+    'doi_items': ('doi', 'item'),
+    'item_authors': ('item', 'author'),
+    'author_employers': ('author', 'employer'),
+    'all_labels': ('item', 'label')
+}
+
+TRIPLE_RE = re.compile(r'<([^>]*)>\s+<([^>]*)>\s+(.*?)\s*\.\s*$')
+LITERAL_RE = re.compile(r'"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<[^>]*>)?$')
+ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f'}
+
+
+def unescape(string):
+    """ Resolve N-Triples escape sequences in a literal """
+    if '\\' not in string:
+        return string
+
+    def replace(match):
+        code = match.group(1)
+        if code[0] in 'uU' and len(code) > 1:
+            return chr(int(code[1:], 16))
+        return ESCAPES.get(code, code)
+
+    return ESCAPE_RE.sub(replace, string)
+
+
+def open_dump(path):
+    """ Open (possibly gzip or bzip2 compressed) dump in binary mode, '-' for stdin """
+    if path == '-':
+        return os.fdopen(sys.stdin.buffer.fileno(), 'rb', closefd=False)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_statements(lines, lang='en'):
+    """ Parse the kept statements from N-Triples lines (bytes).
+    Yields (table, subject, object) with entity URIs shortened to their ids """
+    # Cheap test on raw bytes before parsing, labels only in `lang`
+    needle = re.compile(b'<' + re.escape(DIRECT.encode()) + b'P(?:356|50|108)> |<'
+                        + re.escape(RDFS_LABEL.encode()) + b'> .*"@'
+                        + re.escape(lang.encode()) + rb'\s*\.\s*$')
+    tables = {DOI: 'doi_items', AUTHOR: 'item_authors', EMPLOYER: 'author_employers',
+              RDFS_LABEL: 'all_labels'}
+    for line in lines:
+        if needle.search(line) is None:
+            continue
+        match = TRIPLE_RE.match(line.decode('utf-8').strip())
+        if match is None or match.group(2) not in tables or not match.group(1).startswith(ENTITY):
+            continue
+        subject, predicate, obj = match.groups()
+        subject = subject[len(ENTITY):]
+        if obj.startswith('<'):
+            if not obj.startswith('<' + ENTITY):
+                continue
+            obj = obj[len(ENTITY) + 1:-1]
+        else:
+            literal = LITERAL_RE.match(obj)
+            if literal is None:
+                continue
+            obj = unescape(literal.group(1))
+        yield tables[predicate], subject, obj
+
+
+def build_index(lines, db, dois=None, lang='en', chunk_size=100000):
+    """ Fill `db` from the dump `lines`, restricted to the items with one of
+    `dois` (upper case) if given """
+    for table, columns in TABLES.items():
+        db.execute(f'CREATE TABLE {table} ({columns[0]} TEXT, {columns[1]} TEXT)')
+    rows = {table: [] for table in TABLES}
+
+    def flush(table):
+        db.executemany(f'INSERT INTO {table} VALUES (?, ?)', rows[table])
+        rows[table] = []
+
+    for table, subject, obj in tqdm(iter_statements(lines, lang), unit=' statements'):
+        if table == 'doi_items':
+            # DOI first, the item it identifies second
+            subject, obj = obj.upper(), subject
+            if dois is not None and subject not in dois:
+                continue
+        rows[table].append((subject, obj))
+        if len(rows[table]) >= chunk_size:
+            flush(table)
+    for table in TABLES:
+        flush(table)
+
+    # Statements are in subject order, so only now it is known what is needed
+    db.execute('CREATE INDEX doi_items_doi ON doi_items (doi)')
+    db.execute('DELETE FROM item_authors WHERE item NOT IN (SELECT item FROM doi_items)')
+    db.execute('CREATE INDEX item_authors_item ON item_authors (item)')
+    db.execute('DELETE FROM author_employers WHERE author NOT IN (SELECT author FROM item_authors)')
+    db.execute('CREATE INDEX author_employers_author ON author_employers (author)')
+    db.execute('CREATE TABLE labels (item TEXT PRIMARY KEY, label TEXT)')
+    db.execute('INSERT OR IGNORE INTO labels SELECT item, label FROM all_labels '
+               'WHERE item IN (SELECT employer FROM author_employers)')
+    db.execute('DROP TABLE all_labels')
+    db.commit()
+    db.execute('VACUUM')
+
+
+class WikidataIndex:
+    """ Lookups in an index built by build_index, in the format of
+    harvest_covid19_Wikidata.lookup_batch """
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+
+    def lookup(self, dois):
+        """ Authors per DOI (matched case-insensitively) and employers
+        [label, qid] per author for a batch of DOIs """
+        doi_authors = {}
+        author_employers = {}
+        for doi in dois:
+            authors = [author for author, in self.db.execute(
+                'SELECT DISTINCT author FROM doi_items JOIN item_authors USING (item) '
+                'WHERE doi = ?', (doi.upper(),))]
+            doi_authors[doi] = authors
+            for author in authors:
+                if author not in author_employers:
+                    # Like the label service, fall back to the id
+                    author_employers[author] = [list(row) for row in self.db.execute(
+                        'SELECT DISTINCT coalesce(label, employer), employer '
+                        'FROM author_employers LEFT JOIN labels ON employer = item '
+                        'WHERE author = ?', (author,))]
+        return doi_authors, author_employers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument("dump", help="Wikidata truthy N-Triples dump (.nt, .nt.gz, .nt.bz2 or - for stdin)")
+    parser.add_argument("index", help="sqlite file to create")
+    parser.add_argument("--dois", default=None,
+                        help="Only index items with one of these DOIs (one per line)")
+    parser.add_argument("--lang", default='en', help="Language of the employer labels")
+    args = parser.parse_args()
+
+    if os.path.exists(args.index):
+        parser.error(f"'{args.index}' exists")
+    dois = None
+    if args.dois:
+        with open(args.dois, 'r') as fhandle:
+            dois = {line.strip().upper() for line in fhandle if line.strip()}
+
+    db = sqlite3.connect(args.index)
+    with open_dump(args.dump) as fhandle:
+        build_index(fhandle, db, dois=dois, lang=args.lang)
+    for table in ['doi_items', 'item_authors', 'author_employers', 'labels']:
+        print(table, db.execute(f'SELECT count(*) FROM {table}').fetchone()[0])
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,84 +8,291 @@ __license__ = "ISC license"
 __email__ = "seidlmayer@zbmed.de"
 __version__ = "1 "
 
-import pandas as pd
-import xml.etree.ElementTree as et
-from SPARQLWrapper import SPARQLWrapper, JSON
 import argparse
 import csv
+import json
+import queue
+import sqlite3
+import threading
+import time
+import urllib.error
+import xml.etree.ElementTree as et
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from SPARQLWrapper import SPARQLWrapper, JSON, POST
+from SPARQLWrapper.SPARQLExceptions import EndPointInternalError
+
+from build_wikidata_index import WikidataIndex
 
 user_agent = "TakeItPersonally, https://github.com/foerstner-lab/TIP-lib"
-wd_url = SPARQLWrapper("https://query.wikidata.org/sparql", agent=user_agent)
+wd_endpoint = "https://query.wikidata.org/sparql"
+
+# Rate limit and transient server errors, retried after Retry-After or with backoff
+RETRY_CODES = (429, 502, 503, 504)
+
+
+class QueryTooHeavy(Exception):
+    """ Raised if the endpoint times out on a query (HTTP 500 on WDQS) """
+
+
+def sparql_literal(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def authors_query(dois):
+    """ Authors of the items with any of `dois` (P356) and their employers,
+    one row per doi, author and employer """
+    # Wikidata stores DOIs in upper case
+    variants = sorted(set(dois) | {doi.upper() for doi in dois})
+    return f'''SELECT ?doi ?author ?employer ?employerLabel
+            WHERE {{ VALUES ?doi {{ {' '.join(sparql_literal(doi) for doi in variants)} }}
+            ?item wdt:P356 ?doi .
+            ?item wdt:P50 ?author .
+            OPTIONAL {{ ?author wdt:P108 ?employer . }}
+            SERVICE wikibase:label {{ bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }}
+            }}'''
+
+
+def run_query(query, endpoint=wd_endpoint, retries=5, backoff=2.0, timeout=120):
+    """ Result bindings of a SPARQL query, retrying throttled and failed requests.
+    Raises QueryTooHeavy on timeouts, as the same query would time out again. """
+    sparql = SPARQLWrapper(endpoint, agent=user_agent)
+    sparql.setMethod(POST)
+    sparql.setReturnFormat(JSON)
+    sparql.setTimeout(timeout)
+    sparql.setQuery(query)
+    for attempt in range(retries + 1):
+        try:
+            return sparql.query().convert()['results']['bindings']
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_CODES or attempt == retries:
+                raise
+            retry_after = e.headers.get('Retry-After')
+            wait = float(retry_after) if retry_after and retry_after.isdigit() \
+                else backoff * 2 ** attempt
+        except (EndPointInternalError, TimeoutError) as e:
+            raise QueryTooHeavy(str(e)) from e
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, TimeoutError):
+                raise QueryTooHeavy(str(e)) from e
+            if attempt == retries:
+                raise
+            wait = backoff * 2 ** attempt
+        print(f'Retrying in {wait:.0f}s')
+        time.sleep(wait)
+
+
+def qid(uri):
+    return uri.rsplit('/', 1)[1]
+
+
+class Cache:
+    """ Authors per DOI and employers [label, qid] per author QID in a sqlite
+    file, an empty list marks a lookup without results. Lookups are skipped
+    per DOI; employers are fetched by the same batch query as the authors,
+    the author table only holds them for writing the rows. """
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS doi_authors (doi TEXT PRIMARY KEY, authors TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS author_employers '
+                        '(author TEXT PRIMARY KEY, employers TEXT)')
+
+    def authors(self, doi):
+        row = self.db.execute('SELECT authors FROM doi_authors WHERE doi = ?', (doi,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def employers(self, author):
+        row = self.db.execute('SELECT employers FROM author_employers WHERE author = ?',
+                              (author,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def add(self, doi_authors, author_employers):
+        self.db.executemany('INSERT OR REPLACE INTO doi_authors VALUES (?, ?)',
+                            [(doi, json.dumps(authors)) for doi, authors in doi_authors.items()])
+        self.db.executemany('INSERT OR REPLACE INTO author_employers VALUES (?, ?)',
+                            [(author, json.dumps(employers))
+                             for author, employers in author_employers.items()])
+        self.db.commit()
+
+
+def lookup_batch(dois, endpoint=wd_endpoint, retries=5):
+    """ Authors per DOI and employers per author for a batch of DOIs.
+    Batches the endpoint times out on are split in halves; single DOIs that
+    still time out are left out of the result, so they stay uncached. """
+    try:
+        bindings = run_query(authors_query(dois), endpoint=endpoint, retries=retries)
+    except QueryTooHeavy:
+        if len(dois) == 1:
+            print(f'Query timed out for {dois[0]}')
+            return {}, {}
+        half = len(dois) // 2
+        print(f'Query timed out, splitting batch of {len(dois)} DOIs')
+        doi_authors, author_employers = lookup_batch(dois[:half], endpoint, retries)
+        more_authors, more_employers = lookup_batch(dois[half:], endpoint, retries)
+        doi_authors.update(more_authors)
+        for author, employers in more_employers.items():
+            author_employers[author] = employers
+        return doi_authors, author_employers
+    by_variant = {}
+    for doi in dois:
+        by_variant.setdefault(doi, set()).add(doi)
+        by_variant.setdefault(doi.upper(), set()).add(doi)
+    doi_authors = {doi: [] for doi in dois}
+    author_employers = {}
+    for res in bindings:
+        author = qid(res['author']['value'])
+        for doi in by_variant.get(res['doi']['value'], ()):
+            if author not in doi_authors[doi]:
+                doi_authors[doi].append(author)
+        employers = author_employers.setdefault(author, [])
+        if 'employer' in res:
+            employer = [res['employerLabel']['value'], qid(res['employer']['value'])]
+            if employer not in employers:
+                employers.append(employer)
+    return doi_authors, author_employers
+
+
+def iter_docs(path):
+    """ Flatten each doc of a Solr XML export in one pass into a dict of its
+    fields' texts (first occurrence per tag), dropping processed docs """
+    stack = []
+    for event, elem in et.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag != 'doc':
+            continue
+        fields = {}
+        for child in elem:
+            fields.setdefault(child.tag, child.text)
+        yield fields
+        # Only processed docs precede the current position in the parent
+        (stack[-1] if stack else elem).clear()
+
+
+def read_batches(path, batch_size, batches):
+    """ Put lists of (DBRECORDID, DOI, TITLE) of the docs that have these
+    fields into queue `batches`, followed by None (or the exception) """
+    try:
+        batch = []
+        for doc in iter_docs(path):
+            if all(key in doc for key in ('DBRECORDID', 'DOI', 'TITLE')):
+                batch.append((doc['DBRECORDID'], doc['DOI'], doc['TITLE']))
+            if len(batch) >= batch_size:
+                batches.put(batch)
+                batch = []
+        if batch:
+            batches.put(batch)
+        batches.put(None)
+    except Exception as e:
+        batches.put(e)
+
+
+def iter_queue(batches):
+    while True:
+        batch = batches.get()
+        if isinstance(batch, Exception):
+            raise batch
+        if batch is None:
+            return
+        yield batch
+
+
+def write_rows(csv_writer, cache, docs):
+    """ Rows of docs whose DOI is cached, returns the number of others """
+    n_missing = 0
+    for dbrecordid, doi, title in docs:
+        authors = cache.authors(doi) if doi else []
+        if authors is None:
+            # Lookup failed
+            n_missing += 1
+            continue
+        if not authors:
+            csv_writer.writerow((dbrecordid, doi, title, '', ''))
+        for author_qnr in authors:
+            employers = cache.employers(author_qnr)
+            if not employers:
+                csv_writer.writerow((dbrecordid, doi, title, author_qnr, ''))
+            # Each row lists the employers up to this one (label, qid, label, qid, ...)
+            singleemployer = []
+            for employer in employers or []:
+                singleemployer.extend(employer)
+                csv_writer.writerow((dbrecordid, doi, title, author_qnr, list(singleemployer)))
+    return n_missing
+
 
 def main():
     parser = argparse.ArgumentParser(description=__description__)
     parser.add_argument("input")
     parser.add_argument("output")
+    parser.add_argument("--endpoint", default=wd_endpoint, help="SPARQL endpoint")
+    parser.add_argument("--batch-size", type=int, default=200,
+                        help="Number of DOIs per SPARQL query")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Number of concurrent queries (query.wikidata.org allows 5 per IP)")
+    parser.add_argument("--retries", type=int, default=5,
+                        help="Retries of throttled or failed queries")
+    parser.add_argument("--cache", default=None,
+                        help="sqlite file caching the results per DOI and author across runs, "
+                        "so reruns only look up missing DOIs (default: <output>.cache.db, "
+                        "':memory:' for none)")
+    parser.add_argument("--offline", default=None,
+                        help="Answer lookups from this index (see build_wikidata_index.py) "
+                        "instead of the SPARQL endpoint")
     args = parser.parse_args()
 
-    xtree = et.parse(args.input)
-    xroot = xtree.getroot()
+    cache = Cache(args.cache or args.output + '.cache.db')
+    index = WikidataIndex(args.offline) if args.offline else None
+    # Parsing runs ahead of the lookups by at most a few batches
+    batches = queue.Queue(maxsize=2 * args.workers)
+    reader = threading.Thread(target=read_batches, daemon=True,
+                              args=(args.input, args.batch_size, batches))
+    reader.start()
 
-    docs = xroot.findall('.//doc')
-
-    with open(args.output, 'a') as csvfile:
+    n_docs = n_requested = n_missing = 0
+    requested = set()
+    # Rows are written from the cache, so each run rewrites the complete output
+    with open(args.output, 'w') as csvfile, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor:
         csv_writer = csv.writer(csvfile)
         csv_writer.writerow(['DBRECORDID','doi', 'title','author_qnr', 'author_affiliation'])
 
-        for doc in docs:
-            d = {key.tag: doc.find(key.tag).text for key in doc.iter() if key.tag != 'doc'}
-            # doc_list.append(d)
-            # print('keys', d.keys())
-
+        def finish(docs, future):
             try:
-                doi = d['DOI']
-                dbrecordid = d['DBRECORDID']
-                title = d['TITLE']
-                author_query = f'''SELECT distinct ?author 
-                            WHERE {{ ?item wdt:P356 ?doi .    
-                            Values ?doi {{ '{doi}' }}. 
-                            {{ ?item wdt:P50 ?author }}. 
-                            SERVICE wikibase:label {{ bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }}
-                            }}'''
-                wd_url.setQuery(author_query)
-                wd_url.setReturnFormat(JSON)
-                results = wd_url.query().convert()
-                #print(results)
-                if (len(results['results']['bindings'])) > 0:
-                    for res in results['results']['bindings']:
-                        author_qnr = res['author']['value'].rsplit('/', 1)[1]
-
-
-                        singleemployer = []
-                        aff_query = f"""SELECT distinct ?employer ?employerLabel   
-                                    WHERE {{ VALUES ?item {{ wd:{author_qnr} }}.    
-                                        ?item wdt:P108 ?employer .
-                                    SERVICE wikibase:label {{ bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }} 
-                                    }}"""
-                        #print(aff_query)
-                        wd_url.setQuery(aff_query)
-                        wd_url.setReturnFormat(JSON)
-                        aff_results = wd_url.query().convert()
-                        if (len(aff_results["results"]["bindings"])) > 0:
-                            for res in aff_results["results"]["bindings"]:
-                                singleemployer.append(res["employerLabel"]["value"])
-                                singleemployer.append(res["employer"]["value"].rsplit("/", 1)[1])
-                                affiliation = singleemployer
-                                infos = dbrecordid, doi, title, author_qnr, affiliation
-                                print('1:',infos)
-                                csv_writer.writerow(infos)
-                        else:
-                            affiliation = ''
-                            infos = dbrecordid, doi, title, author_qnr, affiliation
-                            print('2:', infos)
-                            csv_writer.writerow(infos)
-                else:
-                    author_qnr = ''
-                    affiliation = ''
-                    infos = dbrecordid, doi, title, author_qnr, affiliation
-                    print('3:', infos)
-                    csv_writer.writerow(infos)
-            except:
-                pass
-
-main()
\ No newline at end of file
+                if future is not None:
+                    cache.add(*future.result())
+            except Exception as e:
+                # Not cached, so a rerun looks them up again
+                print('Lookup failed:', e)
+            return write_rows(csv_writer, cache, docs)
+
+        # Lookups in flight, finished in input order
+        pending = deque()
+        for docs in iter_queue(batches):
+            n_docs += len(docs)
+            todo = list(dict.fromkeys(doi for __, doi, __ in docs if doi and doi not in requested
+                                      and cache.authors(doi) is None))
+            requested.update(todo)
+            n_requested += len(todo)
+            future = None
+            if todo and index is not None:
+                future = Future()
+                future.set_result(index.lookup(todo))
+            elif todo:
+                future = executor.submit(lookup_batch, todo, args.endpoint, args.retries)
+            pending.append((docs, future))
+            if len(pending) > args.workers:
+                n_missing += finish(*pending.popleft())
+        while pending:
+            n_missing += finish(*pending.popleft())
+
+    print(f'{n_docs} docs, looked up {n_requested} uncached DOIs')
+    if n_missing:
+        print(f'{n_missing} docs without results because lookups failed, '
+              'rerun to look up only these (others are cached)')
+
+
+if __name__ == '__main__':
+    main()
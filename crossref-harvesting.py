@@ -15,82 +15,83 @@ import argparse
 import subprocess
 from pandas import read_csv
 import logging
-import jsonlines
 import csv
 
+from from_qgraph.jsonl_reader import JSON_DECODERS, iter_jsonl
+
 
 # curl is needed for the subprocess:
-def check_references(row, curl_command, csv_writer):
+def check_references(row, curl_command, csv_writer, json_decoder='auto'):
         doi = row['doi']
 
         result = subprocess.run(f"{curl_command} https://api.crossref.org/works/{doi} --output tmp.json".split())
         logging.info(result)
 
-        with jsonlines.open('./tmp.json') as reader:
-            for obj in reader:
+        for obj in iter_jsonl('./tmp.json', decoder=json_decoder):
 
 # harvest only references  from Crossref
 
-                for reference in obj['message']['reference']:
-                    reference_to = reference.get('DOI')
-                    infos = doi, reference_to
-                    print('INFOS:', infos)
-                    csv_writer.writerow(infos)
+            for reference in obj['message']['reference']:
+                reference_to = reference.get('DOI')
+                infos = doi, reference_to
+                print('INFOS:', infos)
+                csv_writer.writerow(infos)
 
 
 
 # harvest publication title and ISSN from Crossref
-                '''
-                for paper in obj['message']['ISSN']:
-                    issn = paper
-                for titel  in obj['message']['title']:
-                    title = titel
+            '''
+            for paper in obj['message']['ISSN']:
+                issn = paper
+            for titel  in obj['message']['title']:
+                title = titel
 
-                    infos = doi, title, issn
+                infos = doi, title, issn
 
-                    print('paper_id, issn:', infos)
-                    csv_writer.writerow(infos)
-                
+                print('paper_id, issn:', infos)
+                csv_writer.writerow(infos)
+            
 
 # harvest ISSN from Crossref
-                
-                for paper in obj['message']['ISSN']:
-                    issn = paper
-                    infos = doi, issn
-                    print('paper_id, issn:', infos)
-                    csv_writer.writerow(infos)
-                
+            
+            for paper in obj['message']['ISSN']:
+                issn = paper
+                infos = doi, issn
+                print('paper_id, issn:', infos)
+                csv_writer.writerow(infos)
+            
 
 # harvest references and journal names from Crossref
-                
-                for reference in obj['message']['reference']:
-                    reference_to = reference.get('DOI')
-                    if 'journal-title' in reference.keys():
-                        journal = reference['journal-title']
-                    else:
-                        journal = ('')
-                    infos = doi, reference_to, journal
-                    print('INFOS:', infos)
-                    csv_writer.writerow(infos)
-                
+            
+            for reference in obj['message']['reference']:
+                reference_to = reference.get('DOI')
+                if 'journal-title' in reference.keys():
+                    journal = reference['journal-title']
+                else:
+                    journal = ('')
+                infos = doi, reference_to, journal
+                print('INFOS:', infos)
+                csv_writer.writerow(infos)
+            
 # harvest name (given, family) and ORCIDs from Crossref
-                
-                for author in obj['message']['author']:
-                    given = author.get('given')
-                    family = author.get('family')
-                    name = family, given
-                    if 'ORCID' in author.keys():
-                        orcid = author['ORCID'].rsplit('/', 1)[1]
-                    else:
-                        orcid = ('')
-                    infos = doi, name, orcid
-                    print('INFOS', infos)
-                    csv_writer.writerow(infos)
-                '''
+            
+            for author in obj['message']['author']:
+                given = author.get('given')
+                family = author.get('family')
+                name = family, given
+                if 'ORCID' in author.keys():
+                    orcid = author['ORCID'].rsplit('/', 1)[1]
+                else:
+                    orcid = ('')
+                infos = doi, name, orcid
+                print('INFOS', infos)
+                csv_writer.writerow(infos)
+            '''
 
 def main():
     parser = argparse.ArgumentParser(description=__description__)
     parser.add_argument('--curl_command', default='curl')
+    parser.add_argument('--json_decoder', choices=JSON_DECODERS, default='auto')
     parser.add_argument('input_file_csv') # needs to contain the DOIs for requesting references
     parser.add_argument('output_file_csv')
     args = parser.parse_args()
@@ -116,7 +117,7 @@ def main():
         for index, row in input.iterrows():
             try:
                 if row['doi']:
-                    check_references(row, args.curl_command, csv_writer)
+                    check_references(row, args.curl_command, csv_writer, args.json_decoder)
                     #print('main', row['doi'])
 
             except Exception as e:
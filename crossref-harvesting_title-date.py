@@ -13,45 +13,46 @@ import argparse
 import subprocess
 from pandas import read_csv
 import logging
-import jsonlines
 import csv
 
+from from_qgraph.jsonl_reader import JSON_DECODERS, iter_jsonl
+
 
 # curl is needed for the subprocess:
-def check_references(row, curl_command, csv_writer):
+def check_references(row, curl_command, csv_writer, json_decoder='auto'):
         doi = row['paper_id']
         #doi = row['reference_to_doi']
 
         result = subprocess.run(f"{curl_command} https://api.crossref.org/works/{doi} --output tmp.json".split())
         logging.info(result)
 
-        with jsonlines.open('./tmp.json') as reader:
-            for obj in reader:
+        for obj in iter_jsonl('./tmp.json', decoder=json_decoder):
 
 
 # harvest publication title and ISSN from Crossref
-                for titel in obj['message']['title']:
-                    title = titel
-                try:
-                    for date in obj['message']['published-online']['date-parts']:
-                        online_date = date
-                except:
-                    online_date = ''
-                try:
-                    for date in obj['message']['published-print']['date-parts']:
-                        print_date = date
-                except:
-                    print_date = ''
+            for titel in obj['message']['title']:
+                title = titel
+            try:
+                for date in obj['message']['published-online']['date-parts']:
+                    online_date = date
+            except:
+                online_date = ''
+            try:
+                for date in obj['message']['published-print']['date-parts']:
+                    print_date = date
+            except:
+                print_date = ''
 
-                infos = doi, title, online_date, print_date
+            infos = doi, title, online_date, print_date
 
-                print('paper_id, issn, online_date, print_date:', infos)
-                csv_writer.writerow(infos)
+            print('paper_id, issn, online_date, print_date:', infos)
+            csv_writer.writerow(infos)
 
 
 def main():
     parser = argparse.ArgumentParser(description=__description__)
     parser.add_argument('--curl_command', default='curl')
+    parser.add_argument('--json_decoder', choices=JSON_DECODERS, default='auto')
     parser.add_argument('input_file_csv') # needs to contain the DOIs for requesting references
     parser.add_argument('output_file_csv')
     args = parser.parse_args()
@@ -70,7 +71,7 @@ def main():
             try:
                 if row['paper_id']:
                 #if row['reference_to_doi']:
-                    check_references(row, args.curl_command, csv_writer)
+                    check_references(row, args.curl_command, csv_writer, args.json_decoder)
 
             except Exception as e:
                 print('Exception', e)
@@ -1,23 +1,68 @@
+"""
+Extract the DOIs of EconBiz records, as fetched with fetch_econbiz.py
+(JSON array or JSON lines). Records are read one at a time. Each distinct
+DOI is printed once, canonicalized to lowercase https://doi.org/ form.
+"""
 import argparse
-import json
+import sys
+
+from from_qgraph.jsonl_reader import JSON_DECODERS, iter_json_records
+
+DOI_PREFIXES = ('https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/')
+
 
 def is_doi(s):
-    return s.startswith('https://doi.org/')
+    return s.lower().startswith(DOI_PREFIXES)
+
 
-parser = argparse.ArgumentParser()
+def canonical_doi(s):
+    """ Lowercase DOI without resolver prefix (DOIs are case-insensitive) """
+    s = s.strip().lower()
+    for prefix in DOI_PREFIXES:
+        if s.startswith(prefix):
+            return s[len(prefix):]
+    return s
 
-parser.add_argument('jsonfile', help="Input")
 
-args = parser.parse_args()
+def iter_dois(records):
+    """ Yield each distinct DOI in `identifier_url` of records once """
+    seen = set()
+    for obj in records:
+        for identifier in obj.get('identifier_url', []):
+            if not is_doi(identifier):
+                continue
+            doi = canonical_doi(identifier)
+            if doi not in seen:
+                seen.add(doi)
+                yield doi
 
-with open(args.jsonfile, 'r') as file:
-    data = json.load(file)
 
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('jsonfile', help="Input: JSON array or JSON lines")
+    parser.add_argument('-o', '--output', default=None, help="Output file (default: stdout)")
+    parser.add_argument('--bare', default=False, action='store_true',
+                        help="Print DOIs without https://doi.org/ prefix")
+    parser.add_argument("--json-decoder", choices=JSON_DECODERS, default='auto',
+                        help="JSON decoder for JSON lines input, 'auto' uses the fastest available")
+    parser.add_argument('--buffer-size', type=int, default=10000,
+                        help="Number of DOIs written at once")
+    args = parser.parse_args()
 
+    prefix = '' if args.bare else 'https://doi.org/'
+    outfile = open(args.output, 'w') if args.output else sys.stdout
+    buffer = []
+    try:
+        for doi in iter_dois(iter_json_records(args.jsonfile, decoder=args.json_decoder)):
+            buffer.append(prefix + doi + '\n')
+            if len(buffer) >= args.buffer_size:
+                outfile.writelines(buffer)
+                buffer = []
+        outfile.writelines(buffer)
+    finally:
+        if args.output:
+            outfile.close()
 
 
-for obj in data:
-    if 'identifier_url' in obj:
-        for identifier in obj['identifier_url']:
-            if is_doi(identifier):
-                print(identifier)
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,121 @@
+"""
+Fetch all EconBiz records matching a query.
+
+Pages are fetched concurrently and written as they arrive, in order, as
+JSON lines (one record per line, readable by from_qgraph/harvest_econbiz.py)
+or, with --format json, as a single JSON array.
+
+The API only pages through the first WINDOW hits of a query. Larger result
+sets are split into date ranges (by year) that each fit into the window.
+"""
 import argparse
-import requests
 import json
+import sys
 from tqdm import tqdm
-from itertools import chain
-parser = argparse.ArgumentParser()
+
+from from_qgraph.fetching import make_session, map_ordered
 
 SIZE = 250  # 250 is maximum for EconBiz API
+WINDOW = 10000  # Maximum from + size for deep paging
 SEARCH = "https://api.econbiz.de/v1/search"
 
-parser.add_argument('--query', '-q', default="COVID-19", help="Query string")
-# parser.add_argument('--start', default="2020-01-01", help="Start date YY-MM-DD")
-# parser.add_argument('--end', default="2020-08-31", help="End date YY-MM-DD")
-parser.add_argument('--output', '-o', default=None, help="Output path")
-
-args = parser.parse_args()
-
-query = args.query
-
-# First query to get number of records
-ret = requests.get(SEARCH, params={'q': query, 'size': 0})
-if not ret.ok:
-    print(f"Error occurred while connecting to: '{SEARCH}'")
-data = ret.json()
-n = int(data['hits']['total'])
-print(f"Found {n} records for query '{query}'.")
-
-def scroll(pos):
-    ret = requests.get(SEARCH, params={'q': query, 'size': SIZE, 'from': pos})
-    assert ret.ok
-    data = ret.json()
-    return data['hits']['hits']
-
-# Second query to get actual data
-list_of_record_lists = []
-for cursor in tqdm(range(0, n, SIZE), desc="Fetching record data"):
-    list_of_record_lists.append(scroll(cursor))
-records = list(chain.from_iterable(list_of_record_lists))
-
-if args.output:
-    print(f"Saving records to '{args.output}'.")
-    with open(args.output, 'w') as outfile:
-        json.dump(records, outfile)
-else:
-    print(json.dumps(records, indent=4))
+
+def date_query(query, start, end, field='date'):
+    """ Restrict query to records with `field` in years [start, end] """
+    return f"({query}) AND {field}:[{start} TO {end}]"
+
+
+def count_hits(session, query):
+    ret = session.get(SEARCH, params={'q': query, 'size': 0})
+    ret.raise_for_status()
+    return int(ret.json()['hits']['total'])
+
+
+def partition(session, query, n, start, end, field='date'):
+    """ Split query into (query, n_hits) parts of at most WINDOW hits each
+    by recursively halving the year range [start, end] """
+    if n <= WINDOW:
+        return [(query, n)] if n else []
+    if start >= end:
+        print(f"Warning: {n} records in {start}, only the first {WINDOW} can be fetched.",
+              file=sys.stderr)
+        return [(query, WINDOW)]
+    parts = []
+    mid = (start + end) // 2
+    for part_start, part_end in [(start, mid), (mid + 1, end)]:
+        part_query = date_query(query, part_start, part_end, field=field)
+        part_n = count_hits(session, part_query)
+        parts.extend(partition(session, part_query, part_n, part_start, part_end, field=field))
+    return parts
+
+
+def fetch_page(session, query, pos):
+    ret = session.get(SEARCH, params={'q': query, 'size': SIZE, 'from': pos})
+    ret.raise_for_status()
+    return ret.json()['hits']['hits']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--query', '-q', default="COVID-19", help="Query string")
+    parser.add_argument('--output', '-o', default=None, help="Output path")
+    parser.add_argument('--format', choices=['jsonl', 'json'], default='jsonl',
+                        help="jsonl: one record per line, json: a single array")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Number of concurrent requests")
+    parser.add_argument('--retries', type=int, default=5,
+                        help="Retries per request with exponential backoff")
+    parser.add_argument('--start-year', type=int, default=1900,
+                        help="First year of date partitions for large result sets")
+    parser.add_argument('--end-year', type=int, default=2030,
+                        help="Last year of date partitions for large result sets")
+    parser.add_argument('--date-field', default='date',
+                        help="Field for date partitions")
+    args = parser.parse_args()
+
+    query = args.query
+    session = make_session(retries=args.retries, pool_size=args.workers)
+
+    # First query to get number of records
+    n = count_hits(session, query)
+    print(f"Found {n} records for query '{query}'.", file=sys.stderr)
+    parts = partition(session, query, n, args.start_year, args.end_year,
+                      field=args.date_field)
+    n_covered = sum(part_n for __, part_n in parts)
+    if len(parts) > 1:
+        print(f"Split query into {len(parts)} date ranges covering {n_covered} records.",
+              file=sys.stderr)
+    if n_covered < n:
+        print(f"Warning: {n - n_covered} records are outside of the date ranges "
+              "or beyond the paging window and will not be fetched.", file=sys.stderr)
+
+    # Second query to get actual data
+    pages = [(part_query, pos) for part_query, part_n in parts
+             for pos in range(0, part_n, SIZE)]
+    outfile = open(args.output, 'w') if args.output else sys.stdout
+    if args.output:
+        print(f"Saving records to '{args.output}'.", file=sys.stderr)
+    n_written = 0
+    try:
+        if args.format == 'json':
+            outfile.write('[')
+        for records in tqdm(map_ordered(lambda page: fetch_page(session, *page), pages,
+                                        n_workers=args.workers),
+                            total=len(pages), desc="Fetching record data"):
+            for record in records:
+                if args.format == 'json':
+                    outfile.write(',\n' if n_written else '\n')
+                    outfile.write(json.dumps(record))
+                else:
+                    outfile.write(json.dumps(record) + '\n')
+                n_written += 1
+        if args.format == 'json':
+            outfile.write('\n]\n')
+    finally:
+        if args.output:
+            outfile.close()
+    print(f"Fetched {n_written} records.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk export of the ZB MED Knowledge Environment Solr index.
+
+Pages through the results with cursorMark (sorted by the unique key), so each
+page costs the same regardless of depth. The result set is split into
+disjoint partitions by the values of --partition-field, which are exported
+concurrently. Records are written as gzipped JSON lines shards of at most
+--shard-size records, and manifest.json records each finished shard together
+with the cursor to continue from. Rerunning with the same output directory
+resumes an interrupted export.
+
+With --since (or --since-state, the state.json of a previous harvest by
+from_qgraph/harvest_livivo_covid19.py), only records with the same or a later
+RECORDDATE are exported, to be merged into that harvest with its --update option.
+
+    python3 fetch_ke_solr.py -q 'MESH:"COVID-19"' --fq 'PUBLYEAR:2020' -o ke_export --workers 4
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from from_qgraph.fetching import make_session
+from from_qgraph.solr import KE_SOLR_URL, solr_quote, solr_select
+
+MANIFEST = 'manifest.json'
+
+
+class Manifest:
+    """ Export state, saved atomically after each finished shard """
+    def __init__(self, outdir, settings):
+        self.path = os.path.join(outdir, MANIFEST)
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as fhandle:
+                self.data = json.load(fhandle)
+            if self.data['settings'] != settings:
+                raise ValueError(f"'{self.path}' belongs to an export with different settings")
+        else:
+            self.data = {'settings': settings, 'partitions': {}}
+
+    def partition(self, fq):
+        with self.lock:
+            return self.data['partitions'].setdefault(
+                fq, {'num_found': None, 'cursor': '*', 'shards': [], 'done': False})
+
+    def update(self, fq, **changes):
+        with self.lock:
+            self.data['partitions'][fq].update(changes)
+            self.save()
+
+    def add_shard(self, fq, shard, cursor):
+        with self.lock:
+            state = self.data['partitions'][fq]
+            state['shards'].append(shard)
+            state['cursor'] = cursor
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fhandle:
+            json.dump(self.data, fhandle, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def partition_queries(session, solr_url, params, field):
+    """ Filter queries that split the result set by the values of `field`,
+    including one for records without a value """
+    if not field:
+        return ['*:*']
+    response = solr_select(session, solr_url, {
+        **params, 'rows': 0, 'facet': 'true', 'facet.field': field,
+        'facet.limit': -1, 'facet.mincount': 1
+    })
+    values = response['facet_counts']['facet_fields'][field][::2]
+    return ['{}:{}'.format(field, solr_quote(str(value))) for value in values] \
+        + ['-{}:[* TO *]'.format(field)]
+
+
+def export_partition(session, solr_url, params, fq, index, outdir, manifest,
+                     rows=1000, shard_size=50000, progress=None):
+    """ Export all records matching `fq` in addition to `params`, continuing
+    after the last finished shard of this partition """
+    state = manifest.partition(fq)
+    if state['done']:
+        return
+    cursor = state['cursor']
+    query = {**params, 'fq': params.get('fq', []) + [fq], 'rows': rows}
+    shard_records = []
+
+    def write_shard(next_cursor):
+        fname = 'part-{:04d}-{:05d}.jsonl.gz'.format(index, len(state['shards']))
+        with gzip.open(os.path.join(outdir, fname), 'wt', encoding='utf-8') as fhandle:
+            for record in shard_records:
+                fhandle.write(json.dumps(record) + '\n')
+        manifest.add_shard(fq, {'file': fname, 'records': len(shard_records)}, next_cursor)
+
+    while True:
+        response = solr_select(session, solr_url, {**query, 'cursorMark': cursor})
+        if state['num_found'] is None:
+            manifest.update(fq, num_found=response['response']['numFound'])
+        docs = response['response']['docs']
+        next_cursor = response['nextCursorMark']
+        shard_records.extend(docs)
+        if progress is not None:
+            progress.update(len(docs))
+        done = next_cursor == cursor
+        if len(shard_records) >= shard_size or (done and shard_records):
+            # Shards end at page boundaries, so the next cursor resumes after them
+            write_shard(next_cursor)
+            shard_records = []
+        if done:
+            break
+        cursor = next_cursor
+    n_records = sum(shard['records'] for shard in state['shards'])
+    if n_records != state['num_found']:
+        print(f"Warning: exported {n_records} of {state['num_found']} records for '{fq}'")
+    manifest.update(fq, done=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-q', '--query', default='*:*', help="Solr query")
+    parser.add_argument('--fq', default=[], nargs='*', help="Additional filter queries")
+    parser.add_argument('--fl', default=None, help="Fields to export (default: all)")
+    parser.add_argument('-o', '--output', required=True, help="Output directory")
+    parser.add_argument('--solr-url', default=KE_SOLR_URL, help="Base url of the Solr core")
+    parser.add_argument('--unique-key', default='id', help="Unique key field of the core")
+    parser.add_argument('--partition-field', default='PUBLYEAR',
+                        help="Export partitions by values of this field concurrently "
+                        "(empty string: single partition)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of concurrent partitions")
+    parser.add_argument('--rows', type=int, default=1000, help="Records per request")
+    parser.add_argument('--shard-size', type=int, default=50000, help="Records per shard file")
+    since = parser.add_mutually_exclusive_group()
+    since.add_argument('--since', default=None,
+                       help="Only export records with this or a later RECORDDATE")
+    since.add_argument('--since-state', default=None,
+                       help="Only export records with a RECORDDATE at or after the watermark "
+                       "in this state.json of a previous harvest")
+    args = parser.parse_args()
+
+    params = {'q': args.query, 'fq': list(args.fq), 'sort': f'{args.unique_key} asc'}
+    if args.since_state:
+        with open(args.since_state, 'r') as fhandle:
+            args.since = json.load(fhandle)['watermark']
+        if args.since is None:
+            parser.error(f"'{args.since_state}' has no watermark")
+    if args.since:
+        # Inclusive lower bound: records indexed after the previous harvest may share
+        # the watermark's date. Refetched papers are replaced by DOI on --update.
+        # The watermark is taken verbatim from the records.
+        params['fq'].append('RECORDDATE:[{} TO *]'.format(solr_quote(args.since)))
+    if args.fl:
+        params['fl'] = args.fl
+    os.makedirs(args.output, exist_ok=True)
+    settings = {'solr_url': args.solr_url, **params,
+                'partition_field': args.partition_field, 'shard_size': args.shard_size}
+    manifest = Manifest(args.output, settings)
+
+    session = make_session(pool_size=args.workers)
+    fqs = [fq for fq in manifest.data['partitions']]
+    if not fqs:
+        fqs = partition_queries(session, args.solr_url, params, args.partition_field)
+        for fq in fqs:
+            manifest.partition(fq)
+        manifest.save()
+    print(f"Exporting {len(fqs)} partitions to '{args.output}'")
+
+    with tqdm(unit='records') as progress, ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(export_partition, session, args.solr_url, params, fq, index,
+                                   args.output, manifest, rows=args.rows,
+                                   shard_size=args.shard_size, progress=progress)
+                   for index, fq in enumerate(fqs)]
+        for future in futures:
+            future.result()
+
+    partitions = manifest.data['partitions'].values()
+    print("Exported {} records in {} shards".format(
+        sum(shard['records'] for state in partitions for shard in state['shards']),
+        sum(len(state['shards']) for state in partitions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Download all records of a query from the ZB MED KE (LIVIVO) SRU interface.
+
+The total is requested first (maximumRecords=0), then the startRecord windows
+are fetched concurrently. Each window's record count is verified before it
+is stored as gzipped xml (readable by from_qgraph/harvest_livivo_covid19.py).
+Finished windows are listed in manifest.json, so rerunning with the same
+output directory only fetches the missing windows.
+
+    python3 fetch_ke_sru.py -q 'dc.subject=covid19 AND dc.date=2020' -o /mnt/2021_covid++/ke_data --workers 8
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from tqdm import tqdm
+
+from from_qgraph.fetching import make_session
+from from_qgraph.sru import iter_sru_records, number_of_records
+
+SRU_URL = "http://z3950.zbmed.de:6210/livivo"
+MANIFEST = 'manifest.json'
+
+
+class WindowError(Exception):
+    """ Raised if a window does not contain the expected number of records """
+
+
+def sru_params(query, start, maximum, username):
+    return {
+        'version': '2.0',
+        'operation': 'searchRetrieve',
+        'query': query,
+        'facetLimit': 0,
+        'startRecord': start,
+        'recordSchema': 'xml',
+        'x-username': username,
+        'maximumRecords': maximum
+    }
+
+
+def fetch_total(session, url, query, username):
+    ret = session.get(url, params=sru_params(query, 1, 0, username), timeout=60)
+    ret.raise_for_status()
+    return number_of_records(io.BytesIO(ret.content))
+
+
+def fetch_window(session, url, query, username, start, size, expected, outdir,
+                 retries=5, backoff=2.0):
+    """ Fetch window of `size` records at `start`, verify that it holds
+    `expected` records and store it gzipped. Returns file name and count.
+    HTTP errors are retried by `session`; incomplete, truncated or unparsable
+    responses are requested again up to `retries` times. """
+    fname = 'window-{:08d}.xml.gz'.format(start)
+    for attempt in range(retries + 1):
+        try:
+            ret = session.get(url, params=sru_params(query, start, size, username), timeout=300)
+            ret.raise_for_status()
+            n_records = sum(1 for __ in iter_sru_records(io.BytesIO(ret.content)))
+            if n_records != expected:
+                raise WindowError(f"Window {start}: expected {expected} records, got {n_records}")
+            break
+        except requests.HTTPError:
+            # Status codes were already retried by the session
+            raise
+        except (requests.RequestException, WindowError, ET.ParseError):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+    tmp_path = os.path.join(outdir, fname + '.tmp')
+    with gzip.open(tmp_path, 'wb') as fhandle:
+        fhandle.write(ret.content)
+    os.replace(tmp_path, os.path.join(outdir, fname))
+    return fname, n_records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-q', '--query', default='dc.subject=covid19 AND dc.date=2020',
+                        help="SRU query (CQL)")
+    parser.add_argument('-o', '--output', required=True, help="Output directory")
+    parser.add_argument('--url', default=SRU_URL, help="SRU endpoint")
+    parser.add_argument('--username', default='zbmintern', help="x-username parameter")
+    parser.add_argument('--window-size', type=int, default=5000,
+                        help="Records per request (maximumRecords)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of concurrent requests")
+    parser.add_argument('--retries', type=int, default=5,
+                        help="Retries per request on HTTP errors, and per window on "
+                        "incomplete or truncated responses, with exponential backoff")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST)
+    settings = {'url': args.url, 'query': args.query, 'window_size': args.window_size}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as fhandle:
+            manifest = json.load(fhandle)
+        if manifest['settings'] != settings:
+            parser.error(f"'{manifest_path}' belongs to a harvest with different settings")
+    else:
+        manifest = {'settings': settings, 'total': None, 'windows': {}}
+
+    session = make_session(retries=args.retries, pool_size=args.workers)
+    if manifest['total'] is None:
+        manifest['total'] = fetch_total(session, args.url, args.query, args.username)
+    total = manifest['total']
+    print(f"Found {total} records for query '{args.query}'")
+
+    windows = [(start, min(args.window_size, total - start + 1))
+               for start in range(1, total + 1, args.window_size)]
+
+    def finished(start):
+        window = manifest['windows'].get(str(start))
+        return window is not None and os.path.exists(os.path.join(args.output, window['file']))
+
+    todo = [(start, expected) for start, expected in windows if not finished(start)]
+    print(f"Fetching {len(todo)} of {len(windows)} windows")
+
+    lock = threading.Lock()
+
+    def save_manifest():
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as fhandle:
+            json.dump(manifest, fhandle, indent=1)
+        os.replace(tmp_path, manifest_path)
+
+    save_manifest()
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(fetch_window, session, args.url, args.query, args.username,
+                                   start, args.window_size, expected, args.output,
+                                   retries=args.retries): start
+                   for start, expected in todo}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            start = futures[future]
+            try:
+                fname, n_records = future.result()
+            except Exception as e:
+                print(f"Window {start} failed: {e}")
+                failed.append(start)
+                continue
+            with lock:
+                manifest['windows'][str(start)] = {'file': fname, 'records': n_records}
+                save_manifest()
+
+    n_records = sum(window['records'] for window in manifest['windows'].values())
+    print(f"Stored {n_records} of {total} records in {len(manifest['windows'])} windows")
+    if failed:
+        print(f"{len(failed)} windows failed, rerun to resume")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
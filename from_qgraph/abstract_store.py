@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact on-disk store of abstracts with random access by DOI.
+
+A store with prefix `abstracts` consists of three files:
+    abstracts.blob     zlib-compressed abstracts, concatenated
+    abstracts.offsets  int64 offsets into the blob (native byte order), one more than abstracts
+    abstracts.dois     one DOI per line, in the same order as the offsets
+
+Blob and offsets are memory-mapped by `AbstractStore`, so only the DOI index
+is held in memory.
+"""
+import mmap
+import zlib
+from array import array
+
+
+class AbstractStoreWriter:
+    """ Append abstracts to a store, use as context manager """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.blob = open(prefix + '.blob', 'wb')
+        self.offsets = open(prefix + '.offsets', 'wb')
+        self.dois = open(prefix + '.dois', 'w')
+        self.offset = 0
+        array('q', [0]).tofile(self.offsets)
+
+    def add(self, doi, abstract):
+        data = zlib.compress(abstract.encode('utf-8'))
+        self.blob.write(data)
+        self.offset += len(data)
+        array('q', [self.offset]).tofile(self.offsets)
+        print(doi, file=self.dois)
+
+    def close(self):
+        for fhandle in (self.blob, self.offsets, self.dois):
+            fhandle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def _map_file(path):
+    """ Read-only memory map of a file, empty bytes for empty files """
+    with open(path, 'rb') as fhandle:
+        try:
+            return mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Cannot map empty files
+            return b''
+
+
+class AbstractStore:
+    """ Read-only random access to the abstracts of a store by DOI """
+    def __init__(self, prefix):
+        with open(prefix + '.dois', 'r') as fhandle:
+            self.index = {line.rstrip('\n'): i for i, line in enumerate(fhandle)}
+        self.blob = _map_file(prefix + '.blob')
+        self.offsets = memoryview(_map_file(prefix + '.offsets')).cast('q')
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, doi):
+        return doi in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, doi):
+        i = self.index[doi]
+        return zlib.decompress(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def get(self, doi, default=None):
+        return self[doi] if doi in self.index else default
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar batches of harvested papers with their annotations and authorships.
+
+Sources turn raw input (SRU responses, KE Solr exports, LIVIVO, EconBiz, or
+preprint JSON lines) into a stream of `Batch`es of at most `batch_size` papers. All batches share
+the same three tables, each a dict of column lists:
+    paper       paper_id and source-specific columns (e.g. year, title)
+    annotation  paper_id, subject
+    authorship  paper_id, author
+Filter stages and writers operate on such streams regardless of the source.
+Every source yields at least one (possibly empty) batch.
+"""
+import gzip
+import os
+from collections import Counter
+from itertools import compress
+
+import pandas as pd
+from tqdm import tqdm
+
+from jsonl_reader import iter_jsonl
+from sru import SRUFormatError, iter_sru_records, doc_fields, doc_keys
+from utils import strip_qualifier_terms
+
+BATCH_SIZE = 10000
+
+LIVIVO_COLUMNS = ['year', 'title', 'source', 'doi', 'pmId']
+SRU_COLUMNS = ['publdate', 'title']
+ECONBIZ_COLUMNS = ['year', 'title']
+PREPRINT_COLUMNS = ['publdate', 'title']
+
+# Fields read from every SRU record: the filters and the record date,
+# checked before materializing others
+SRU_FILTER_FIELDS = ('sortyear', 'PUBLDATE', 'MESH', 'DOI', 'RECORDDATE')
+# Remaining fields to extract from valid SRU records
+SRU_EXTRACT_FIELDS = ('TITLE', 'AUTHOR')
+# Separator of multiple values in an SRU field
+SRU_SEPARATOR = ' ; '
+
+
+def _row_mask(ends, keep):
+    """ Expand per-paper `keep` flags to the rows of a table,
+    where paper i owns the rows up to `ends[i]` """
+    mask = []
+    start = 0
+    for end, flag in zip(ends, keep):
+        mask.extend([flag] * (end - start))
+        start = end
+    return mask
+
+
+class Batch:
+    """ Columnar tables of a batch of papers. Annotation and authorship rows
+    are stored in the order of their papers. `num_records` counts all input
+    records visited for this batch, `schema` optionally counts their fields.
+    `record_date` is the latest RECORDDATE of the visited KE records, if any. """
+    def __init__(self, paper_columns):
+        self.paper = {'paper_id': [], **{column: [] for column in paper_columns}}
+        self.annotation = {'paper_id': [], 'subject': []}
+        self.authorship = {'paper_id': [], 'author': []}
+        # End of each paper's rows in annotation and authorship
+        self.annotation_ends = []
+        self.authorship_ends = []
+        self.schema = Counter()
+        self.num_records = 0
+        self.record_date = None
+
+    @property
+    def paper_columns(self):
+        return list(self.paper)[1:]
+
+    def __len__(self):
+        return len(self.paper['paper_id'])
+
+    def add(self, paper_id, values, subjects=(), authors=()):
+        """ Add one paper with values for the paper columns, its subjects and authors """
+        self.paper['paper_id'].append(paper_id)
+        for column, value in zip(self.paper_columns, values):
+            self.paper[column].append(value)
+        self.annotation['paper_id'].extend([paper_id] * len(subjects))
+        self.annotation['subject'].extend(subjects)
+        self.annotation_ends.append(len(self.annotation['subject']))
+        self.authorship['paper_id'].extend([paper_id] * len(authors))
+        self.authorship['author'].extend(authors)
+        self.authorship_ends.append(len(self.authorship['author']))
+
+    def extend(self, other):
+        """ Append all papers of batch `other` """
+        for table, other_table in [(self.paper, other.paper),
+                                   (self.annotation, other.annotation),
+                                   (self.authorship, other.authorship)]:
+            for column, values in other_table.items():
+                table[column].extend(values)
+        n_annotations = self.annotation_ends[-1] if self.annotation_ends else 0
+        n_authorships = self.authorship_ends[-1] if self.authorship_ends else 0
+        self.annotation_ends.extend(end + n_annotations for end in other.annotation_ends)
+        self.authorship_ends.extend(end + n_authorships for end in other.authorship_ends)
+        self.schema.update(other.schema)
+        self.num_records += other.num_records
+        self.update_record_date(other.record_date)
+
+    def update_record_date(self, record_date):
+        """ Keep the later of the current and the given record date """
+        if record_date and (self.record_date is None or record_date > self.record_date):
+            self.record_date = record_date
+
+    def select(self, keep, subject_keep=None):
+        """ New batch with the papers flagged in `keep`. If given,
+        `subject_keep` additionally flags the annotation rows to keep. """
+        batch = Batch(self.paper_columns)
+        for column, values in self.paper.items():
+            batch.paper[column] = list(compress(values, keep))
+        annotation_mask = _row_mask(self.annotation_ends, keep)
+        if subject_keep is not None:
+            annotation_mask = [a and b for a, b in zip(annotation_mask, subject_keep)]
+        for column, values in self.annotation.items():
+            batch.annotation[column] = list(compress(values, annotation_mask))
+        authorship_mask = _row_mask(self.authorship_ends, keep)
+        for column, values in self.authorship.items():
+            batch.authorship[column] = list(compress(values, authorship_mask))
+        batch.annotation_ends = _kept_ends(self.annotation_ends, keep, annotation_mask)
+        batch.authorship_ends = _kept_ends(self.authorship_ends, keep, authorship_mask)
+        batch.schema = self.schema
+        batch.num_records = self.num_records
+        batch.record_date = self.record_date
+        return batch
+
+    def head(self, n):
+        """ New batch with the first `n` papers """
+        return self.select([i < n for i in range(len(self))])
+
+    def num_annotated(self):
+        """ Number of papers with at least one annotation """
+        return sum(end > start for start, end in zip([0] + self.annotation_ends,
+                                                      self.annotation_ends))
+
+    def to_dataframes(self, subject_column='subject', unique_papers=False):
+        """ Paper (indexed by paper_id), annotation, and authorship dataframes.
+        With `unique_papers`, each paper_id is kept once at its first position
+        with the values of its last occurrence (like a dict keyed by paper_id). """
+        df_paper = pd.DataFrame(self.paper).set_index('paper_id')
+        if unique_papers:
+            ids = df_paper.index
+            df_paper = df_paper[~ids.duplicated(keep='last')]\
+                .reindex(ids[~ids.duplicated(keep='first')])
+        df_annotation = pd.DataFrame(self.annotation)\
+            .rename(columns={'subject': subject_column})
+        df_authorship = pd.DataFrame(self.authorship)
+        return df_paper, df_annotation, df_authorship
+
+
+def _kept_ends(ends, keep, row_mask):
+    """ Row ends per kept paper after applying `row_mask` """
+    kept_ends = []
+    n_rows = 0
+    start = 0
+    for end, flag in zip(ends, keep):
+        n_rows += sum(row_mask[start:end])
+        start = end
+        if flag:
+            kept_ends.append(n_rows)
+    return kept_ends
+
+
+def make_batches(items, add_record, paper_columns, batch_size=BATCH_SIZE,
+                 progress=True, desc=None, **kwargs):
+    """ Group input records into batches. `add_record(batch, item, **kwargs)`
+    adds the item to the batch if it is valid. """
+    batch = Batch(paper_columns)
+    for item in tqdm(items, desc=desc, disable=not progress):
+        batch.num_records += 1
+        add_record(batch, item, **kwargs)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = Batch(paper_columns)
+    yield batch
+
+
+def concat_batches(batches):
+    """ Concatenate a stream of batches into a single batch """
+    batches = iter(batches)
+    result = next(batches)
+    for batch in batches:
+        result.extend(batch)
+    return result
+
+
+### SOURCES ###
+
+def add_livivo_record(batch, obj, filter_language=None):
+    identifier = obj['_id']['$oid']
+    data = obj['liv']['orig_data']
+    if "MESH" not in data:
+        # There are no mesh terms at all!
+        return
+    if filter_language:
+        if "LANGUAGE" not in data:
+            # Language not specified, drop record
+            return
+        if filter_language not in data["LANGUAGE"]:
+            # Record not in target language, drop record
+            return
+
+    meshterms = strip_qualifier_terms(data['MESH'])
+    if not meshterms:
+        # There are no remaining meshterms, skip to next document
+        return
+
+    batch.add(identifier, [
+        int(data['sortyear'][0]) if 'sortyear' in data else None,
+        data.get('TITLE', [''])[0],
+        data['SOURCE'][0] if 'SOURCE' in data else None,
+        data['DOI'][0] if 'DOI' in data else None,
+        data['DBRECORDID'][1:] if data['DBRECORDID'].startswith('M') else None,
+    ], meshterms, data.get('AUTHOR', []))
+
+
+def livivo_batches(lines, filter_language=None, decoder='auto', prefilter=None, **kwargs):
+    """ Batches from LIVIVO JSON lines, keyed by record id """
+    records = iter_jsonl(lines, decoder=decoder, prefilter=prefilter)
+    return make_batches(records, add_livivo_record, LIVIVO_COLUMNS,
+                        filter_language=filter_language, **kwargs)
+
+
+def split_sru_field(field):
+    return field.split(SRU_SEPARATOR)
+
+
+def ke_record_valid(obj, recent=False, require_publdate=False,
+                    require_mesh=False, require_doi=False):
+    """ Whether a KE record (dict of field texts) passes the filters """
+    if recent:
+        if 'sortyear' not in obj:
+            return False
+        if int(obj['sortyear']) < 2020:
+            return False
+
+    if require_publdate:
+        if 'PUBLDATE' not in obj:
+            return False
+
+    if require_mesh:
+        if 'MESH' not in obj or not obj['MESH']:
+            # Skip, if no MESH or MESH empty
+            return False
+
+    if require_doi:
+        if "DOI" not in obj or not obj["DOI"]:
+            return False
+    return True
+
+
+def add_ke_paper(batch, obj, strip_mesh_qualifiers=False):
+    meshterms = split_sru_field(obj['MESH']) if obj.get('MESH') else []
+    if strip_mesh_qualifiers:
+        # make unique after stripping qualifiers
+        meshterms = strip_qualifier_terms(meshterms)
+
+    # We use DOI as key
+    batch.add(obj.get('DOI') or '', [
+        split_sru_field(obj['PUBLDATE'])[0] if obj.get('PUBLDATE') else '',
+        obj.get('TITLE') or ''
+    ], meshterms, split_sru_field(obj['AUTHOR']) if obj.get('AUTHOR') else [])
+
+
+def add_sru_record(batch, doc, strip_mesh_qualifiers=False, **filters):
+    if doc is None:
+        return
+    obj = doc_fields(doc, SRU_FILTER_FIELDS)
+    if obj.get('RECORDDATE'):
+        batch.update_record_date(max(split_sru_field(obj['RECORDDATE'])))
+    if not ke_record_valid(obj, **filters):
+        return
+
+    batch.schema.update(doc_keys(doc))
+    obj.update(doc_fields(doc, SRU_EXTRACT_FIELDS))
+    add_ke_paper(batch, obj, strip_mesh_qualifiers)
+
+
+def _sru_docs(path):
+    try:
+        yield from iter_sru_records(path)
+    except SRUFormatError:
+        print(f"[skipping] '{path}' does not match expected format, no 'searchRetrieveResponse'")
+
+
+def sru_batches(path, batch_size=BATCH_SIZE, progress=True, **kwargs):
+    """ Batches from an SRU response file, keyed by DOI """
+    return make_batches(_sru_docs(path), add_sru_record, SRU_COLUMNS,
+                        batch_size=batch_size, progress=progress, desc=path, **kwargs)
+
+
+def solr_field_text(value):
+    """ Text of a Solr field as in SRU records, multiple values joined by ' ; ' """
+    if isinstance(value, list):
+        return SRU_SEPARATOR.join(str(v) for v in value) if value else None
+    return str(value)
+
+
+def add_solr_record(batch, doc, strip_mesh_qualifiers=False, **filters):
+    obj = {key: solr_field_text(value) for key, value in doc.items()}
+    if obj.get('RECORDDATE'):
+        batch.update_record_date(max(split_sru_field(obj['RECORDDATE'])))
+    if not ke_record_valid(obj, **filters):
+        return
+    batch.schema.update(obj.keys())
+    add_ke_paper(batch, obj, strip_mesh_qualifiers)
+
+
+def solr_batches(path, batch_size=BATCH_SIZE, progress=True, **kwargs):
+    """ Batches from a (gzipped) JSON lines shard of a KE Solr export
+    (see fetch_ke_solr.py), keyed by DOI like `sru_batches` """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as fhandle:
+        yield from make_batches(iter_jsonl(fhandle), add_solr_record, SRU_COLUMNS,
+                                batch_size=batch_size, progress=progress, desc=path,
+                                **kwargs)
+
+
+def add_econbiz_record(batch, obj, filter_language=None):
+    if filter_language:
+        if "language" not in obj:
+            # Language not specified, drop record
+            return
+        if filter_language not in obj["language"]:
+            # Record not in target language, drop record
+            return
+    batch.add(obj['econbiz_id'], [obj.get('date'), obj['title']],
+              [subject['stw_id'] for subject in obj.get('subject_stw', [])],
+              [author['name'] for author in obj.get('creator_personal', [])])
+
+
+def econbiz_batches(lines, filter_language=None, decoder='auto', **kwargs):
+    """ Batches from EconBiz JSON lines, keyed by econbiz_id """
+    return make_batches(iter_jsonl(lines, decoder=decoder), add_econbiz_record,
+                        ECONBIZ_COLUMNS, filter_language=filter_language, **kwargs)
+
+
+def add_preprint_record(batch, obj):
+    # Make concepts unique!
+    concepts = list(dict.fromkeys(entity['concept'] for entity in obj['ents']))
+    batch.add(obj['id'], [obj['date'], obj['title']], concepts)
+    batch.schema.update(obj.keys())
+
+
+def preprint_batches(lines, decoder='auto', **kwargs):
+    """ Batches from preprint JSON lines with keys id, date, title, ents """
+    return make_batches(iter_jsonl(lines, decoder=decoder), add_preprint_record,
+                        PREPRINT_COLUMNS, **kwargs)
+
+
+### FILTER STAGES ###
+
+def filter_subjects(batches, subjects, strict=False):
+    """ Keep papers with at least one of `subjects`.
+    If `strict`, also drop all other subjects of these papers. """
+    for batch in batches:
+        subject_keep = [subject in subjects for subject in batch.annotation['subject']]
+        keep = [any(subject_keep[start:end]) for start, end
+                in zip([0] + batch.annotation_ends, batch.annotation_ends)]
+        yield batch.select(keep, subject_keep if strict else None)
+
+
+def require_subjects(batches):
+    """ Keep only papers with at least one subject """
+    for batch in batches:
+        yield batch.select([end > start for start, end
+                            in zip([0] + batch.annotation_ends, batch.annotation_ends)])
+
+
+def limit_papers(batches, limit):
+    """ Stop after `limit` papers """
+    n_papers = 0
+    for batch in batches:
+        if n_papers + len(batch) >= limit:
+            yield batch.head(limit - n_papers)
+            return
+        n_papers += len(batch)
+        yield batch
+
+
+### WRITERS ###
+
+def write_tables(outdir, dfs, args=None):
+    """ Write (name, dataframe, whether to save index) tables as csv files
+    to `outdir`, and the command line `args` to args.txt """
+    os.makedirs(outdir, exist_ok=True)
+    for fname, dframe, save_index in dfs:
+        dframe.to_csv(os.path.join(outdir, fname + '.csv'),
+                      index=save_index)
+    if args is not None:
+        with open(os.path.join(outdir, 'args.txt'), 'w') as fh:
+            print(args, file=fh)
+
+
+def merge_tables(outdir, dfs, key='paper_id'):
+    """ Upsert (name, dataframe, whether to save index) tables into the csv
+    files previously written to `outdir`: all rows of papers present in the
+    new tables replace their old rows, other old rows are kept.
+    Returns the merged tables in the same format. """
+    keys = set()
+    for __, dframe, save_index in dfs:
+        keys.update(dframe.index if save_index else dframe[key])
+    # Papers without key cannot be matched, they are only appended
+    keys.discard('')
+    merged = []
+    for fname, dframe, save_index in dfs:
+        old = pd.read_csv(os.path.join(outdir, fname + '.csv'), dtype=str,
+                          keep_default_na=False, index_col=0 if save_index else None)
+        old_keys = old.index if save_index else old[key]
+        merged.append((fname, pd.concat([old[~old_keys.isin(keys)], dframe]), save_index))
+    return merged
+
+
+class CSVBatchWriter:
+    """ Append batches to paper.csv, annotation.csv, and authorship.csv in `outdir`
+    without keeping them in memory, use as context manager """
+    def __init__(self, outdir, subject_column='subject',
+                 tables=('paper', 'annotation', 'authorship')):
+        os.makedirs(outdir, exist_ok=True)
+        self.subject_column = subject_column
+        self.files = {table: open(os.path.join(outdir, table + '.csv'), 'w', newline='')
+                      for table in tables}
+        self.header = True
+
+    def write(self, batch):
+        tables = {
+            'paper': pd.DataFrame(batch.paper),
+            'annotation': pd.DataFrame(batch.annotation)
+                          .rename(columns={'subject': self.subject_column}),
+            'authorship': pd.DataFrame(batch.authorship)
+        }
+        for table, fhandle in self.files.items():
+            tables[table].to_csv(fhandle, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        for fhandle in self.files.values():
+            fhandle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers for fetching from web APIs: a pooled requests session that retries
+failed requests with exponential backoff, and a bounded concurrent map.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Status codes worth retrying: rate limit and transient server errors
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def make_session(retries=5, backoff=1.0, pool_size=10):
+    """ Session with a connection pool of `pool_size` per host that retries
+    up to `retries` times, waiting backoff * 2^i seconds (or Retry-After) """
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUS, allowed_methods=None,
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size,
+                          pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def map_ordered(fn, items, n_workers=4, prefetch=2):
+    """ Like map(fn, items) in `n_workers` threads. Yields results in input
+    order while at most `prefetch * n_workers` items are in flight. """
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= prefetch * n_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
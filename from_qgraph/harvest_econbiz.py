@@ -11,9 +11,10 @@ Last Change: Mon Jan 21 10:27:21 CET 2019
 """
 import os
 import argparse
-import jsonlines
-import pandas as pd
-from tqdm import tqdm
+
+from batches import concat_batches, econbiz_batches, limit_papers, require_subjects, \
+    write_tables
+from jsonl_reader import JSON_DECODERS
 
 
 def getsome(data, key):
@@ -43,76 +44,32 @@ def main():
                         help="Normalize string columns")
     parser.add_argument("--debug", type=int, default=None,
                         help="Parse fewer lines to create a debugging dataset")
+    parser.add_argument("--json-decoder", choices=JSON_DECODERS, default='auto',
+                        help="JSON decoder, 'auto' uses the fastest available")
     args = parser.parse_args()
-    papers = {}
-    paper_author = []
-    paper_subject = []
-    n_lines = 0
-    n_with_annotations = 0
-    for path in args.files:
-        print("Harvesting", path)
-        with jsonlines.open(path) as jsonfile:
-            for jsonobj in tqdm(jsonfile):
-                if args.debug is not None and n_lines > args.debug:
-                    print("Collected %d lines, stopping." % n_lines)
-                    break
-                if args.filter_language:
-                    if "language" not in jsonobj:
-                        # Language not specified, drop record
-                        continue
-                    if args.filter_language not in jsonobj["language"]:
-                        # Record not in target language, drop record
-                        continue
-
-                if args.only_annotated:
-                    # If desired, we skip non-annotated papers.
-                    if 'subject_stw' not in jsonobj or not jsonobj['subject_stw']:
-                        # Paper has no annotations, continue
-                        continue
-
-                # Extract paper info
-                identifier = jsonobj['econbiz_id']
-
-                if 'date' in jsonobj:
-                    date = jsonobj['date']
-                else:
-                    # Clear potential date of last iteration
-                    date = None
-
-                title = jsonobj['title']
-
-                # if identifier in papers:
-                #     raise UserWarning("Duplicate paper id: " + identifier)
-                papers[identifier] = (date, title)
-                # Extract author info
-                # Use empty list if author not specified as key
-                if 'creator_personal' in jsonobj:
-                    authors = [a['name'] for a in jsonobj['creator_personal']]
-                    for author in authors:
-                        paper_author.append((identifier, author))
-
-                if 'subject_stw' in jsonobj:
-                    n_with_annotations += 1
-                    for subject in jsonobj['subject_stw']:
-                        paper_subject.append((identifier, subject["stw_id"]))
-                # if 'subject_gnd' in jsonobj:  # THESE ARE AUTHORS!!!!!
-                #     for subject in jsonobj['subject_gnd']:
-                #         # GND subjects have 'gnd_id' and 'name'.
-                #         # We use 'name' for now.
-                #         paper_subject.append((identifier, subject['name']))
-                n_lines += 1
+
+    def file_batches():
+        for path in args.files:
+            print("Harvesting", path)
+            yield from econbiz_batches(path, filter_language=args.filter_language,
+                                       decoder=args.json_decoder)
+
+    batches = file_batches()
+    if args.only_annotated:
+        # If desired, we skip non-annotated papers.
+        batches = require_subjects(batches)
+    if args.debug is not None:
+        batches = limit_papers(batches, args.debug)
+    batch = concat_batches(batches)
+    if args.debug is not None and len(batch) >= args.debug:
+        print("Collected %d lines, stopping." % len(batch))
+
+    df_paper, df_paper_subject, df_paper_author = batch.to_dataframes(unique_papers=True)
+    # Paper ids are stored as unnamed index
+    df_paper = df_paper.rename_axis(None)
     print("Found %d papers with %d authors and %d annotations."
-          % (len(papers), len(paper_author), len(paper_subject)))
-    print("%d papers do have stw annotations" % n_with_annotations)
-
-    df_paper = pd.DataFrame.from_dict(papers,
-                                       orient='index',
-                                       columns=['year',
-                                                'title'])
-    df_paper_subject = pd.DataFrame(paper_subject,
-                                    columns=['paper_id', 'subject'])
-    df_paper_author = pd.DataFrame(paper_author,
-                                   columns=['paper_id', 'author'])
+          % (len(df_paper), len(df_paper_author), len(df_paper_subject)))
+    print("%d papers do have stw annotations" % batch.num_annotated())
 
     sanity_check(df_paper)
     sanity_check(df_paper_subject)
@@ -139,10 +96,7 @@ def main():
         ('authorship', df_paper_author, False)
     ]
     print("Storing files to", args.output)
-    os.makedirs(args.output, exist_ok=True)
-    for fname, dframe, save_index in dfs:
-        dframe.to_csv(os.path.join(args.output, fname + '.csv'),
-                      index=save_index)
+    write_tables(args.output, dfs)
 
 
 if __name__ == '__main__':
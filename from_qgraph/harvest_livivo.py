@@ -13,12 +13,14 @@ Last Change: Mon Oct 21 2019 -- 16:16
 import argparse
 import os
 import zipfile
-import jsonlines
 import re
 import sys
 
 import pandas as pd
-from tqdm import tqdm
+
+from batches import BATCH_SIZE, concat_batches, filter_subjects, limit_papers, \
+    livivo_batches, write_tables
+from jsonl_reader import JSON_DECODERS, LinePrefilter, map_jsonl
 
 def filter_by_top_counts(dataframe, col, keep):
     if isinstance(keep, float):
@@ -31,101 +33,48 @@ def filter_by_top_counts(dataframe, col, keep):
     return dataframe[dataframe[col].isin(top_items)]
 
 
-def strip_mesh_qualifier(meshterm):
-    """ Strip off qualifier terms from mesh terms,
-    which are usually appended with a slash '/' """
-    return meshterm.split('/')[0].strip()
+def harvest_records(lines_iter, filter_mesh_terms=None,
+                    strict_mesh_filter=False,
+                    filter_language=None, limit=None, progress=True,
+                    decoder='auto', prefilter=True, batch_size=BATCH_SIZE):
+    """ Harvest papers with their keywords and authors from lines into a single batch """
+    line_filter = None
+    if prefilter:
+        # Skip decoding lines that cannot pass the filters below
+        line_filter = LinePrefilter(
+            required=['MESH'] + ([filter_language] if filter_language else []),
+            any_of=filter_mesh_terms)
+    batches = livivo_batches(lines_iter, filter_language=filter_language,
+                             decoder=decoder, prefilter=line_filter,
+                             batch_size=batch_size, progress=progress)
+    if filter_mesh_terms is not None:
+        # Only documents with at least one mesh term in target filter
+        batches = filter_subjects(batches, filter_mesh_terms, strict=strict_mesh_filter)
+    if limit:
+        batches = limit_papers(batches, limit)
+    return concat_batches(batches)
+
+
+def partials_to_dataframes(partials):
+    """ Merge partial batches (in order) into paper, keyword, and author dataframes """
+    batch = concat_batches(partials)
+    print("Harvested metadata of %d papers" % len(batch))
+    df_paper, df_paper_keyword, df_paper_author = batch.to_dataframes(unique_papers=True)
+    # Paper ids are stored as unnamed index
+    df_paper = df_paper.rename_axis(None)
+    return df_paper, df_paper_keyword, df_paper_author
 
 
-def strip_qualifier_terms(meshterms):
-    """
-    Strip qualifier term(s) from meshterm that were appended via '/'.
-    The result will contain each mesh term only once.
-    """
-    result = []
-    for meshterm in meshterms:
-        meshterm = strip_mesh_qualifier(meshterm)
-        if meshterm not in result:
-            result.append(meshterm)
-
-    return result
-
-
-
-def harvest_lines(lines_iter, filter_mesh_terms=None,
-                  strict_mesh_filter=False,
-                  filter_language=None, limit=None):
-    json = jsonlines.Reader(lines_iter)
-    flat_gen = ((d['_id']['$oid'], d['liv']['orig_data']) for d in json)
-    papers = {}
-    paper_author = []
-    paper_keyword = []
-
-    n_extracted = 0
-
-    for identifier, data in tqdm(flat_gen):
-        if limit and n_extracted > limit:
-            break
-        if "MESH" not in data:
-            # There are no mesh terms at all!
-            continue
-        if filter_language:
-            if "LANGUAGE" not in data:
-                # Language not specified, drop record
-                continue
-            if filter_language not in data["LANGUAGE"]:
-                # Record not in target language, drop record
-                continue
-
-        meshterms = strip_qualifier_terms(data['MESH'])
-
-        if not meshterms:
-            # There are no remaining meshterms, skip to next document
-            continue
-
-        if filter_mesh_terms is not None:
-            if not any(mterm in filter_mesh_terms for mterm in meshterms):
-                # No mesh term of document is included in target filter
-                continue
-
-        title = data.get('TITLE', [''])[0]
-
-        papers[identifier] = [
-            int(data['sortyear'][0]) if 'sortyear' in data else None,
-            title,
-            data['SOURCE'][0] if 'SOURCE' in data else None,
-            data['DOI'][0] if 'DOI' in data else None,
-            data['DBRECORDID'][1:] if data['DBRECORDID'].startswith('M') else None,
-        ]
-
-        if 'AUTHOR' in data:
-            for author in data['AUTHOR']:
-                paper_author.append((identifier, author))
-
-        for meshterm in meshterms:
-            # Add paper,meshterm tuples to table
-            if filter_mesh_terms is not None and strict_mesh_filter:
-                # Only if the term is in the filter!
-                if meshterm in filter_mesh_terms:
-                    paper_keyword.append((identifier, meshterm))
-            else:
-                paper_keyword.append((identifier, meshterm))
-
-        n_extracted += 1
-    print("Harvested metadata of %d papers" % n_extracted)
-    df_paper = pd.DataFrame.from_dict(papers,
-                                      orient='index',
-                                      columns=['year',
-                                               'title',
-                                               'source',
-                                               'doi',
-                                               'pmId'])
-    df_paper_keyword = pd.DataFrame(paper_keyword,
-                                    columns=['paper_id', 'subject'])
-    df_paper_author = pd.DataFrame(paper_author,
-                                   columns=['paper_id', 'author'])
+def harvest_lines(lines_iter, **kwargs):
+    return partials_to_dataframes([harvest_records(lines_iter, **kwargs)])
+
+
+def harvest_parallel(path, n_jobs, batch_size=10000, **kwargs):
+    """ Harvest (possibly zipped) jsonl file at `path` in `n_jobs` processes """
+    partials = map_jsonl(harvest_records, path, n_jobs=n_jobs,
+                         batch_size=batch_size, progress=False, **kwargs)
+    return partials_to_dataframes(partials)
 
-    return df_paper, df_paper_keyword, df_paper_author
 
 def main():
     """ Extracts separate tables from jsonl ines file
@@ -150,6 +99,14 @@ def main():
                         help="Print rough summary to file")
     parser.add_argument("--top-authors", default=None, type=float,
                         help="Fraction of top authors to consider")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes for parsing (-1 for all cores)")
+    parser.add_argument("--batch-size", type=int, default=10000,
+                        help="Lines per batch handed to workers for zipped input")
+    parser.add_argument("--json-decoder", choices=JSON_DECODERS, default='auto',
+                        help="JSON decoder, 'auto' uses the fastest available")
+    parser.add_argument("--no-prefilter", dest='prefilter', default=True, action='store_false',
+                        help="Decode all lines instead of skipping lines that cannot pass the filters")
     args = parser.parse_args()
 
     if args.filter_mesh is not None:
@@ -168,16 +125,21 @@ def main():
         'limit': args.limit,
         'filter_language': args.filter_language,
         'filter_mesh_terms': mesh_filter,
-        'strict_mesh_filter': args.only_filtered_mesh
+        'strict_mesh_filter': args.only_filtered_mesh,
+        'decoder': args.json_decoder,
+        'prefilter': args.prefilter
     }
 
-    if zipfile.is_zipfile(args.jsonl_file):
+    if args.jobs != 1 and args.limit is None:
+        df_paper, df_paper_keyword, df_paper_author = harvest_parallel(
+            args.jsonl_file, args.jobs, batch_size=args.batch_size, **kwargs)
+    elif zipfile.is_zipfile(args.jsonl_file):
         with zipfile.ZipFile(args.jsonl_file, 'r') as z:
             # assume zip archive has only one file
             with z.open(z.infolist()[0]) as f:
                 df_paper, df_paper_keyword, df_paper_author = harvest_lines(f, **kwargs)
     else:
-        with open(args.jsonl_file, 'r') as f:
+        with open(args.jsonl_file, 'rb') as f:
             df_paper, df_paper_keyword, df_paper_author = harvest_lines(f, **kwargs)
 
     if args.top_authors is not None:
@@ -194,12 +156,7 @@ def main():
     ]
 
     # Dumps everything to disk
-    os.makedirs(args.save, exist_ok=True)
-    for fname, dframe, save_index in dfs:
-        dframe.to_csv(os.path.join(args.save, fname + '.csv'),
-                      index=save_index)
-    with open(os.path.join(args.save, 'args.txt'), 'w') as fh:
-        print(args, file=fh)
+    write_tables(args.save, dfs, args)
 
 
 if __name__ == "__main__":
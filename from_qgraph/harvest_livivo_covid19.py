@@ -20,20 +20,16 @@ SCHEMA:
 
 import os
 import argparse
+import json
 from collections import Counter
-from tqdm import tqdm
+from joblib import Parallel, delayed
 
-import xmltodict
 import pandas as pd
 
-def strip_mesh_qualifier(meshterm):
-    """ Strip off qualifier terms from mesh terms,
-    which are usually appended with a slash '/' """
-    return meshterm.split('/')[0].strip()
+from batches import concat_batches, merge_tables, solr_batches, sru_batches, write_tables
 
-def sf(field):
-    """ Split field """
-    return field.split(' ; ')
+# Harvest state in the output directory, holds the latest RECORDDATE harvested
+STATE_FILE = 'state.json'
 
 
 def filter_min_count(paper_concept, min_count):
@@ -46,6 +42,30 @@ def filter_min_count(paper_concept, min_count):
 
 
 
+def harvest_file(infile, **kwargs):
+    """ Harvest papers, authorships and mesh annotations from one SRU response file
+    or KE Solr export shard (*.jsonl, *.jsonl.gz) into a single batch,
+    see `batches.sru_batches` for the filters """
+    if infile.endswith(('.jsonl', '.jsonl.gz')):
+        return concat_batches(solr_batches(infile, **kwargs))
+    return concat_batches(sru_batches(infile, **kwargs))
+
+
+def load_state(outdir):
+    path = os.path.join(outdir, STATE_FILE)
+    if not os.path.exists(path):
+        return {'watermark': None}
+    with open(path, 'r') as fhandle:
+        return json.load(fhandle)
+
+
+def save_state(outdir, state):
+    path = os.path.join(outdir, STATE_FILE)
+    with open(path + '.tmp', 'w') as fhandle:
+        json.dump(state, fhandle, indent=1)
+    os.replace(path + '.tmp', path)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("infile", nargs='+')
@@ -61,113 +81,59 @@ def main():
                         help="Strip mesh qualifier terms (appended via '/')",
                         default=False, action='store_true')
     parser.add_argument("--save", help='Output directory')
+    parser.add_argument("--update", default=False, action='store_true',
+                        help="Merge into the tables of a previous harvest in the --save directory, "
+                        "replacing the rows of papers (by DOI) present in the input")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="How many parallel processes to use for parsing files")
     args = parser.parse_args()
-
-    schema = Counter()
-
-    num_records, num_valid = 0, 0
-
-    papers = []
-    paper_author = []
-    paper_mesh = []
-
-    for infile in args.infile:
-        with open(infile, 'r') as xmlfile:
-            xmldata = xmltodict.parse(xmlfile.read())
-            try:
-                records = xmldata['zs:searchRetrieveResponse']['zs:records']
-            except KeyError:
-                print(f"[skipping] '{infile}' does not match expected format, no 'searchRetrieveResponse' or no 'zs:records'")
-
-        for record in tqdm(records['zs:record'], desc=infile):
-            num_records += 1
-            try:
-                obj = record['zs:recordData']['doc']
-            except KeyError:
-                continue
-            if args.recent:
-                if 'sortyear' not in obj:
-                    continue
-                if int(obj['sortyear']) < 2020:
-                    continue
-
-            if args.require_publdate:
-                if 'PUBLDATE' not in obj:
-                    continue
-                # Raise if cant be converted
-                # tmp = pd.to_datetime(obj['PUBLDATE'], errors='raise', exact=False)
-                # print(obj['PUBLDATE'], '=>', tmp)
-
-            if args.require_mesh:
-                if 'MESH' not in obj or not obj['MESH']:
-                    # Skip, if no MESH or MESH empty
-                    continue
-
-            if args.require_doi:
-                if "DOI" not in obj or not obj["DOI"]:
-                    continue
-
-            # Records
-            num_valid += 1
-            schema.update(obj.keys())
-
-            # We use DOI as key
-            # record_id = obj['DBRECORDID']
-            doi = obj.get('DOI', '')
-            title = obj.get('TITLE', '')
-            date = sf(obj['PUBLDATE'])[0] if 'PUBLDATE' in obj else ''
-            papers.append((doi, date, title))
-
-            if 'AUTHOR' in obj:
-                for author in sf(obj['AUTHOR']):
-                    paper_author.append((doi, author))
-
-            if 'MESH' in obj:
-                meshterms = sf(obj['MESH'])
-                if args.strip_mesh_qualifiers:
-                    meshterms = [strip_mesh_qualifier(m) for m in meshterms]
-                    # make unique after stripping qualifiers
-                    meshterms = list(set(meshterms))
-
-                for meshterm in meshterms:
-                    paper_mesh.append((doi, meshterm))
-
-
-    df_paper = pd.DataFrame(papers,
-                            columns=['paper_id', 'publdate', 'title'])
-    df_paper.set_index('paper_id', inplace=True)
+    if args.update and not args.save:
+        parser.error("--update requires --save")
+
+    kwargs = {
+        'recent': args.recent,
+        'require_publdate': args.require_publdate,
+        'require_mesh': args.require_mesh,
+        'require_doi': args.require_doi,
+        'strip_mesh_qualifiers': args.strip_mesh_qualifiers
+    }
+    batch = concat_batches(Parallel(n_jobs=args.jobs)(
+        delayed(harvest_file)(infile, **kwargs) for infile in args.infile))
+    schema = batch.schema
+    print("Num records:", batch.num_records, "valid:", len(batch))
+
+    df_paper, df_paper_concept, df_paper_author = batch.to_dataframes(subject_column='concept')
     # Days granularity is enough
     # df_paper['publdate'] = pd.to_datetime(df_paper['publdate'],
     #                                       format='%Y-%m-%d', exact=False)
+    dfs = [
+        # dataframe name, dataframe, whether to save index
+        ('paper', df_paper, True),
+        ('annotation', df_paper_concept, False),
+        ('authorship', df_paper_author, False)
+    ]
+    if args.update:
+        print("Merging into", args.save)
+        dfs = merge_tables(args.save, dfs)
+        (__, df_paper, __), (__, df_paper_concept, __), (__, df_paper_author, __) = dfs
     df_paper['publdate'] = pd.to_datetime(df_paper['publdate'])
     print(df_paper.head())
-
-    df_paper_concept = pd.DataFrame(paper_mesh,
-                                    columns=['paper_id', 'concept'])
     print(df_paper_concept.head())
-
-    df_paper_author = pd.DataFrame(paper_author,
-                                   columns=['paper_id', 'author'])
     print(df_paper_author.head())
 
 
 
     if args.save:
         print("Saving results to", args.save)
-        dfs = [
-            # dataframe name, dataframe, whether to save index
-            ('paper', df_paper, True),
-            ('annotation', df_paper_concept, False),
-            ('authorship', df_paper_author, False)
-        ]
-
         # Dumps everything to disk
-        os.makedirs(args.save, exist_ok=True)
-        for fname, dframe, save_index in dfs:
-            dframe.to_csv(os.path.join(args.save, fname + '.csv'),
-                          index=save_index)
-        with open(os.path.join(args.save, 'args.txt'), 'w') as fh:
-            print(args, file=fh)
+        write_tables(args.save, dfs, args)
+        state = load_state(args.save) if args.update else {'watermark': None}
+        # RECORDDATE values share one format, so they compare as strings
+        if batch.record_date and (state['watermark'] is None
+                                  or batch.record_date > state['watermark']):
+            state['watermark'] = batch.record_date
+        save_state(args.save, state)
+        print("Watermark (RECORDDATE):", state['watermark'])
     print(schema)
 
 if __name__ == "__main__":
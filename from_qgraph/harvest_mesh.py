@@ -7,39 +7,163 @@ Author: Steffen Trog
 Email: shtrog@gmail.com
 Github: https://github.com/knorpelsenf
 Description: Extract concept hierarchy from mesh.nt so every (sub)concept refers to a list of broader concepts.
+
+The default 'stream' engine reads the N-Triples file line by line and only
+keeps English labels and broaderDescriptor edges, keyed by descriptor URI.
+The 'rdflib' engine loads the whole file into an rdflib Graph (slow, needs many GB).
 """
 import argparse
+import gzip
 import json
+import re
+import sys
 from tqdm import tqdm
 
-from rdflib import Graph, URIRef
 from collections import defaultdict
 
-broaderDescriptor = URIRef("http://id.nlm.nih.gov/mesh/vocab#broaderDescriptor")
+BROADER_DESCRIPTOR = "http://id.nlm.nih.gov/mesh/vocab#broaderDescriptor"
+SKOS_PREF_LABEL = "http://www.w3.org/2004/02/skos/core#prefLabel"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+# In order of preference, like rdflib's Graph.preferredLabel
+LABEL_PROPERTIES = [SKOS_PREF_LABEL, RDFS_LABEL]
+
+TRIPLE_RE = re.compile(r'<([^>]*)>\s+<([^>]*)>\s+(.*?)\s*\.\s*$')
+LITERAL_RE = re.compile(r'"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<[^>]*>)?$')
+ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f'}
+
+
+def unescape(string):
+    """ Resolve N-Triples escape sequences in a literal """
+    if '\\' not in string:
+        return string
+
+    def replace(match):
+        code = match.group(1)
+        if code[0] in 'uU' and len(code) > 1:
+            return chr(int(code[1:], 16))
+        return ESCAPES.get(code, code)
+
+    return ESCAPE_RE.sub(replace, string)
+
+
+def open_ntriples(path):
+    """ Open (possibly gzipped) N-Triples file in binary mode """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_triples(lines, predicates):
+    """ Parse triples with one of `predicates` from N-Triples lines (bytes).
+    Yields (subject, predicate, object), where object is a URI string
+    for resources and a (value, language) tuple for literals. """
+    needle = re.compile(b'<(?:' + b'|'.join(re.escape(p.encode()) for p in predicates) + b')>')
+    for line in lines:
+        # Cheap test on raw bytes before parsing
+        if needle.search(line) is None:
+            continue
+        match = TRIPLE_RE.match(line.decode('utf-8').strip())
+        if match is None:
+            continue
+        subject, predicate, obj = match.groups()
+        if predicate not in predicates:
+            continue
+        if obj.startswith('<'):
+            obj = sys.intern(obj[1:-1])
+        else:
+            literal = LITERAL_RE.match(obj)
+            if literal is None:
+                continue
+            obj = (unescape(literal.group(1)), literal.group(2))
+        yield sys.intern(subject), predicate, obj
+
+
+def extract_broader_stream(path, lang='en', verbose=False):
+    """ Single pass over the N-Triples file at `path`.
+    Returns dict of concept label -> list of broader concept labels """
+    # Label property -> URI -> first label in `lang`
+    labels = {prop: {} for prop in LABEL_PROPERTIES}
+    # Descriptor URI -> broader descriptor URIs (as ordered set)
+    edges = {}
+    with open_ntriples(path) as fhandle:
+        for subject, predicate, obj in tqdm(iter_triples(fhandle, [BROADER_DESCRIPTOR] + LABEL_PROPERTIES)):
+            if predicate == BROADER_DESCRIPTOR:
+                if isinstance(obj, str):
+                    edges.setdefault(subject, {})[obj] = None
+            elif obj[1] == lang:
+                labels[predicate].setdefault(subject, obj[0])
+    print("#Broader statements:", sum(len(objs) for objs in edges.values()))
+
+    def preferred_label(uri):
+        for prop in LABEL_PROPERTIES:
+            if uri in labels[prop]:
+                return labels[prop][uri]
+        return None
+
+    broader = defaultdict(list)
+    n_unlabeled = 0
+    for subject, objs in edges.items():
+        s_label = preferred_label(subject)
+        for obj in objs:
+            o_label = preferred_label(obj)
+            if s_label is None or o_label is None:
+                n_unlabeled += 1
+                continue
+            if verbose:
+                print(s_label, '->', o_label)
+            broader[s_label].append(o_label)
+    if n_unlabeled:
+        print("Skipped", n_unlabeled, "relationships without", lang, "label")
+    return broader
+
+
+def extract_broader_rdflib(path, lang='en', verbose=False):
+    """ Load the N-Triples file at `path` into an rdflib Graph.
+    Returns dict of concept label -> list of broader concept labels """
+    from rdflib import Graph, URIRef
+
+    def preferred_label(g, uri):
+        # Same as rdflib's former Graph.preferredLabel(uri, lang=lang)[0][1]
+        for prop in LABEL_PROPERTIES:
+            for label in g.objects(uri, URIRef(prop)):
+                if getattr(label, 'language', None) == lang:
+                    return label.value
+        raise IndexError(f"No {lang} label for {uri}")
+
+    g = Graph()
+    g.parse(path, format='nt')
+    print("#Statements:", len(g))
+    broader = defaultdict(list)
+    for s, p, o in tqdm(g.triples((None, URIRef(BROADER_DESCRIPTOR), None))):
+        s_label = preferred_label(g, s)
+        o_label = preferred_label(g, o)
+        if verbose:
+            print(s_label, '->', o_label)
+        broader[s_label].append(o_label)
+    return broader
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('file_in',
-			help="The path to the N-triple file")
+                        help="The path to the N-triple file (may be gzipped with --engine stream)")
     parser.add_argument('file_out',
                         help="Store output json in this file")
-    
+    parser.add_argument('--engine', choices=['stream', 'rdflib'], default='stream',
+                        help="stream: single pass over the file, rdflib: load full graph")
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        help="Print each broader relationship")
+
     args = parser.parse_args()
     print("Loading", args.file_in)
-    g = Graph()
-    g.parse(args.file_in, format='nt')
-    print("#Statements:", len(g))
-    broader = defaultdict(list)
-    for s,p,o in tqdm(g.triples( (None, broaderDescriptor, None) )):
-        # preferredLabel returns list of (property, literal) pairs
-        s_label = g.preferredLabel(s, lang='en')[0][1].value
-        o_label = g.preferredLabel(o, lang='en')[0][1].value
-        print(s_label, '->', o_label)
-        broader[s_label].append(o_label)
+    if args.engine == 'rdflib':
+        broader = extract_broader_rdflib(args.file_in, verbose=args.verbose)
+    else:
+        broader = extract_broader_stream(args.file_in, verbose=args.verbose)
 
     print("Found broader relationships for", len(broader), "concepts")
-    
+
     print("Writing JSON...")
     with open(args.file_out, "w") as file:
         json.dump(broader, file)
@@ -48,4 +172,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -12,65 +12,35 @@ Harvests data from jsonl format with keys "id", "publdate", "title", "abstract",
 import os
 import argparse
 from collections import Counter
-from collections import namedtuple
 
-import jsonlines
-from tqdm import tqdm
-import pandas as pd
+from batches import CSVBatchWriter, preprint_batches
+from jsonl_reader import JSON_DECODERS
 
 
-Publication = namedtuple('Publication', ['paper_id', 'publdate', 'title'])
-Annotation = namedtuple('Annotation', ['paper_id', 'concept'])
-
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("infile")
     parser.add_argument("--save")
+    parser.add_argument("--json-decoder", choices=JSON_DECODERS, default='auto',
+                        help="JSON decoder, 'auto' uses the fastest available")
 
     args = parser.parse_args()
 
-    paper_records, annot_records = [], []
-    schema = Counter()
-    with jsonlines.open(args.infile) as data:
-        for i, obj in tqdm(enumerate(data), desc=args.infile):
-            paper_records.append(
-                Publication(obj["id"],
-                            obj["date"],
-                            obj["title"])
-            )
-
-            # Make concepts unique!
-            concepts = {entity['concept'] for entity in obj['ents']}
-
-            # Add one annotation per unique concept
-            annot_records.extend(
-                [Annotation(obj["id"], concept) for concept in concepts]
-            )
-
-            schema.update(obj.keys())
-
-
-    # Put records into dataframes
-    df_paper = pd.DataFrame(paper_records, columns=Publication._fields)
-    df_paper.set_index("paper_id", inplace=True, drop=True)
-    df_annot = pd.DataFrame(annot_records, columns=Annotation._fields)
+    batches = preprint_batches(args.infile, decoder=args.json_decoder, desc=args.infile)
 
     if args.save:
         print("Saving results to", args.save)
-        dfs = [
-            # dataframe name, dataframe, whether to save index
-            ('paper', df_paper, True),
-            ('annotation', df_annot, False),
-        ]
-
-        # Dumps everything to disk
-        os.makedirs(args.save, exist_ok=True)
-        for fname, dframe, save_index in dfs:
-            dframe.to_csv(os.path.join(args.save, fname + '.csv'),
-                          index=save_index)
+        # Dumps everything to disk as it is harvested
+        with CSVBatchWriter(args.save, subject_column='concept',
+                            tables=('paper', 'annotation')) as writer:
+            for batch in batches:
+                writer.write(batch)
         with open(os.path.join(args.save, 'args.txt'), 'w') as fh:
             print(args, file=fh)
     else:
+        schema = Counter()
+        for batch in batches:
+            schema.update(batch.schema)
         print("Schema:", schema)
 
 
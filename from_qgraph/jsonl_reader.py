@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers for reading large JSON lines files (e.g. LIVIVO dumps), optionally in parallel.
+
+Input is read as bytes with large buffers and decoded with the fastest available
+JSON decoder (orjson, simdjson, or the stdlib json module), see `get_decoder`.
+A `LinePrefilter` may reject raw lines that cannot pass a harvester's filters
+before they reach the decoder.
+
+Plain files are split into newline-aligned byte ranges that are read by the
+worker processes themselves. Zipped input is read sequentially by the main
+process, which hands batches of lines to the workers. In both cases, results
+are returned in input order.
+"""
+import importlib
+import json
+import os
+import re
+import zipfile
+from itertools import islice
+
+from joblib import Parallel, delayed, effective_n_jobs
+
+# Choices for the JSON decoder, 'auto' picks the first available of the others
+JSON_DECODERS = ['auto', 'orjson', 'simdjson', 'json']
+
+# Buffer size for reading input files
+BLOCK_SIZE = 1 << 22
+
+
+def get_decoder(name='auto'):
+    """ Return a function that decodes a JSON document from bytes (or str) """
+    candidates = JSON_DECODERS[1:] if name == 'auto' else [name]
+    for candidate in candidates:
+        try:
+            module = importlib.import_module(candidate)
+        except ImportError:
+            if name != 'auto':
+                raise
+            continue
+        return module.loads
+    raise ValueError(f"Unknown JSON decoder: '{name}'")
+
+
+def is_raw_safe(string):
+    """ Whether `string` appears verbatim in the raw bytes of any JSON document
+    that contains it, i.e. it has no characters that an encoder might escape """
+    return string.isascii() and string.isprintable() and not any(c in string for c in '"\\/')
+
+
+def trie_pattern(words):
+    """ Regex (bytes) matching any of `words`, organized as a trie such that
+    the scan costs about the same for many words as for a single one """
+    end = object()
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(bytes([char]), {})
+        node[end] = True
+
+    def build(node):
+        if end in node:
+            # A shorter word already matches, no need to continue
+            return b''
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return b'(?:' + b'|'.join(alternatives) + b')'
+
+    return build(trie)
+
+
+class LinePrefilter:
+    """ Cheap test on raw JSON lines (bytes) that rejects lines which cannot
+    possibly pass the filters of a harvester, so they need not be decoded.
+
+    required: strings that must occur as JSON strings (keys or values), e.g. "MESH"
+    any_of: substrings of which at least one must occur (e.g. filter mesh terms)
+    min_year: reject lines where all values of `year_key` are below `min_year`
+
+    Strings that a JSON encoder might escape are not used for filtering,
+    so the prefilter never rejects a line that would pass. """
+    YEAR_RE = r'"%s"\s*:\s*\[?\s*"?(\d+)'
+
+    def __init__(self, required=(), any_of=None, min_year=None, year_key='sortyear'):
+        self.required = [('"%s"' % s).encode() for s in required if is_raw_safe(s)]
+        self.any_of = None
+        if any_of and all(s and is_raw_safe(s) for s in any_of):
+            self.any_of = re.compile(trie_pattern(sorted(s.encode() for s in any_of if s)))
+        self.min_year = min_year
+        self.year_re = re.compile((self.YEAR_RE % year_key).encode())
+
+    def __call__(self, line):
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        for pattern in self.required:
+            if pattern not in line:
+                return False
+        if self.any_of is not None and self.any_of.search(line) is None:
+            return False
+        if self.min_year:
+            years = self.year_re.findall(line)
+            if years and all(int(year) < self.min_year for year in years):
+                return False
+        return True
+
+
+def read_lines(fhandle, limit=None):
+    """ Iterate over the lines of file `fhandle`, at most `limit` bytes in total """
+    if limit is None:
+        yield from fhandle
+        return
+    for line in fhandle:
+        yield line
+        limit -= len(line)
+        if limit <= 0:
+            return
+
+
+def decode_lines(lines, decoder='auto', prefilter=None):
+    """ Decode an iterable of JSON lines (bytes or str), skipping empty lines
+    and lines rejected by `prefilter`.
+    `decoder` is a name from JSON_DECODERS or a decoding function. """
+    loads = get_decoder(decoder) if isinstance(decoder, str) else decoder
+    for line in lines:
+        if not line or line.isspace():
+            continue
+        if prefilter is not None and not prefilter(line):
+            continue
+        yield loads(line)
+
+
+def iter_jsonl(source, decoder='auto', prefilter=None, block_size=BLOCK_SIZE):
+    """ Decode JSON lines from `source`, which may be a path, a file object,
+    or an iterable of lines (bytes or str). Paths are read as bytes with a
+    buffer of `block_size` bytes. """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb', buffering=block_size) as fhandle:
+            yield from decode_lines(fhandle, decoder, prefilter)
+    else:
+        yield from decode_lines(source, decoder, prefilter)
+
+
+def iter_json_array(fhandle, chunk_size=1 << 20):
+    """ Decode the elements of a JSON array from text file `fhandle` one at a
+    time, reading `chunk_size` characters at a time """
+    decoder = json.JSONDecoder()
+    buf = fhandle.read(chunk_size).lstrip()
+    if not buf.startswith('['):
+        raise ValueError("Input is not a JSON array")
+    pos = 1
+    eof = False
+    while True:
+        # Skip separators between elements
+        while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ','):
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            if pos == len(buf):
+                raise ValueError("Unexpected end of JSON array")
+            obj, end = decoder.raw_decode(buf, pos)
+            # A number is only complete once a separator follows it
+            complete = eof or (end < len(buf) and (buf[end].isspace() or buf[end] in ',]'))
+        except ValueError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # Element is incomplete, read more
+            chunk = fhandle.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield obj
+        pos = end
+
+
+def iter_json_records(path, decoder='auto', prefilter=None):
+    """ Decode records one at a time from the file at `path`, which holds
+    either a JSON array of records or JSON lines """
+    with open(path, 'r', encoding='utf-8') as fhandle:
+        head = fhandle.read(1 << 10).lstrip()
+    if head.startswith('['):
+        with open(path, 'r', encoding='utf-8') as fhandle:
+            yield from iter_json_array(fhandle)
+    else:
+        yield from iter_jsonl(path, decoder=decoder, prefilter=prefilter)
+
+
+def byte_ranges(path, n_ranges):
+    """ Split file at `path` into at most `n_ranges` (start, end) byte ranges,
+    such that each range starts at the beginning of a line """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as fhandle:
+        for i in range(1, n_ranges):
+            pos = size * i // n_ranges
+            if pos <= bounds[-1]:
+                continue
+            # Move to the start of the next line
+            fhandle.seek(pos - 1)
+            fhandle.readline()
+            bounds.append(min(fhandle.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def iter_range_lines(path, start, end):
+    """ Iterate over the lines (bytes) in byte range [start, end) of file at `path` """
+    with open(path, 'rb', buffering=BLOCK_SIZE) as fhandle:
+        fhandle.seek(start)
+        yield from read_lines(fhandle, limit=end - start)
+
+
+def iter_batches(lines, batch_size):
+    """ Group an iterable of lines into lists of at most `batch_size` lines """
+    lines = iter(lines)
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _apply_to_range(fn, path, start, end, kwargs):
+    return fn(iter_range_lines(path, start, end), **kwargs)
+
+
+def _map_zipped(fn, path, n_jobs, batch_size, kwargs):
+    """ Generator over results for zipped input, keeps the archive open while
+    results are consumed """
+    with zipfile.ZipFile(path, 'r') as zip_archive:
+        # assume zip archive has only one file
+        with zip_archive.open(zip_archive.infolist()[0]) as input_file:
+            yield from Parallel(n_jobs=n_jobs, pre_dispatch='2*n_jobs', return_as='generator')(
+                delayed(fn)(batch, **kwargs)
+                for batch in iter_batches(input_file, batch_size))
+
+
+def map_jsonl(fn, path, n_jobs=1, batch_size=10000, lazy=False, **kwargs):
+    """ Apply `fn(lines, **kwargs)` to parts of the (possibly zipped) JSON
+    lines file at `path` in `n_jobs` parallel processes.
+    Returns the list of results in input order. With `lazy`, returns a generator
+    instead, so results can be consumed while the remaining parts are processed. """
+    n_jobs = effective_n_jobs(n_jobs)
+    if zipfile.is_zipfile(path):
+        results = _map_zipped(fn, path, n_jobs, batch_size, kwargs)
+    else:
+        # Use more ranges than jobs for better load balancing
+        ranges = byte_ranges(path, 4 * n_jobs)
+        results = Parallel(n_jobs=n_jobs, return_as='generator')(
+            delayed(_apply_to_range)(fn, path, start, end, kwargs)
+            for start, end in ranges)
+    return results if lazy else list(results)
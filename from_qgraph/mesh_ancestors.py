@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed ancestor index of the MeSH hierarchy.
+
+Built once from the output of harvest_mesh.py (concept label -> broader
+concept labels), the index stores the transitive closure over integer
+descriptor ids as CSR arrays. An index with prefix `mesh_ancestors` consists of
+    mesh_ancestors.vocab.txt    one descriptor label per line, line number = id
+    mesh_ancestors.indptr.npy   ancestors of id i are indices[indptr[i]:indptr[i+1]]
+    mesh_ancestors.indices.npy  sorted ancestor ids per descriptor
+The arrays are memory-mapped on load.
+
+    python3 from_qgraph/mesh_ancestors.py broader.json -o mesh_ancestors
+    python3 from_qgraph/mesh_ancestors.py broader.json -o mesh_ancestors \\
+        --expand annotation.csv annotation_expanded.csv
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+
+def transitive_closure(parents):
+    """ Ancestor sets for a list of parent id lists (ignoring cycles) """
+    ancestors = [None] * len(parents)
+    for root in range(len(parents)):
+        if ancestors[root] is not None:
+            continue
+        # Iterative post-order DFS, nodes on the stack are in progress
+        stack = [(root, iter(parents[root]))]
+        in_progress = {root}
+        while stack:
+            node, children = stack[-1]
+            for parent in children:
+                if ancestors[parent] is None and parent not in in_progress:
+                    stack.append((parent, iter(parents[parent])))
+                    in_progress.add(parent)
+                    break
+            else:
+                stack.pop()
+                in_progress.discard(node)
+                closure = set(parents[node])
+                for parent in parents[node]:
+                    # Parents in progress (cycle) contribute only themselves
+                    if ancestors[parent] is not None:
+                        closure |= ancestors[parent]
+                closure.discard(node)
+                ancestors[node] = closure
+    return ancestors
+
+
+def build_index(broader):
+    """ Vocabulary and CSR arrays (indptr, indices) of the transitive closure
+    of `broader`, a dict of label -> list of broader labels """
+    vocab = sorted(set(broader) | {label for labels in broader.values() for label in labels})
+    ids = {label: i for i, label in enumerate(vocab)}
+    parents = [[] for __ in vocab]
+    for label, broader_labels in broader.items():
+        parents[ids[label]] = [ids[b] for b in broader_labels]
+    ancestors = transitive_closure(parents)
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in ancestors], out=indptr[1:])
+    indices = np.fromiter((i for a in ancestors for i in sorted(a)),
+                          dtype=np.int32, count=indptr[-1])
+    return vocab, indptr, indices
+
+
+def save_index(prefix, vocab, indptr, indices):
+    with open(prefix + '.vocab.txt', 'w') as fhandle:
+        for label in vocab:
+            print(label, file=fhandle)
+    np.save(prefix + '.indptr.npy', indptr)
+    np.save(prefix + '.indices.npy', indices)
+
+
+class MeshAncestors:
+    """ Ancestor queries on an index saved with `save_index` """
+    def __init__(self, prefix):
+        with open(prefix + '.vocab.txt', 'r') as fhandle:
+            self.vocab = pd.Index([line.rstrip('\n') for line in fhandle])
+        self.indptr = np.load(prefix + '.indptr.npy', mmap_mode='r')
+        self.indices = np.load(prefix + '.indices.npy', mmap_mode='r')
+
+    def __contains__(self, term):
+        return term in self.vocab
+
+    def ancestor_ids(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def ancestors(self, term):
+        """ Labels of all (transitively) broader descriptors of `term` """
+        if term not in self.vocab:
+            return []
+        return list(self.vocab[self.ancestor_ids(self.vocab.get_loc(term))])
+
+    def is_descendant(self, a, b):
+        """ Whether `a` is (transitively) narrower than `b` """
+        if a not in self.vocab or b not in self.vocab:
+            return False
+        ancestor_ids = self.ancestor_ids(self.vocab.get_loc(a))
+        j = self.vocab.get_loc(b)
+        k = np.searchsorted(ancestor_ids, j)
+        return bool(k < len(ancestor_ids) and ancestor_ids[k] == j)
+
+    def expand(self, terms):
+        """ For an array of terms, return (positions, ancestors): one entry per
+        ancestor of each term, where positions index into `terms` """
+        codes = self.vocab.get_indexer(terms)
+        positions = np.flatnonzero(codes >= 0)
+        starts = self.indptr[codes[positions]]
+        counts = self.indptr[codes[positions] + 1] - starts
+        # Gather indices[start:start+count] for all known terms at once
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        ancestor_ids = self.indices[np.repeat(starts, counts) + offsets]
+        return np.repeat(positions, counts), self.vocab[ancestor_ids]
+
+    def expand_annotations(self, df, column='subject', include_self=True):
+        """ Add a row for each ancestor of each annotation in `df` (e.g. an
+        annotation table of the harvesters), keeping the other columns.
+        Added rows are unique and, with `include_self`, not already in `df`.
+        Rows of `df` are kept as they are, including duplicates. """
+        positions, ancestors = self.expand(df[column].to_numpy())
+        expanded = df.iloc[positions].copy()
+        expanded[column] = np.asarray(ancestors)
+        expanded = expanded.drop_duplicates()
+        if not include_self:
+            return expanded.reset_index(drop=True)
+        known = expanded.merge(df.drop_duplicates(), how='left', indicator=True)['_merge']
+        return pd.concat([df, expanded[(known == 'left_only').to_numpy()]], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('broader', help="JSON output of harvest_mesh.py")
+    parser.add_argument('-o', '--output', default='mesh_ancestors',
+                        help="Prefix of the index files")
+    parser.add_argument('--expand', nargs=2, metavar=('IN_CSV', 'OUT_CSV'),
+                        help="Also expand an annotation table to all ancestors")
+    parser.add_argument('--column', default=None,
+                        help="Annotation column to expand (default: second column)")
+    args = parser.parse_args()
+
+    with open(args.broader, 'r') as fhandle:
+        broader = json.load(fhandle)
+    vocab, indptr, indices = build_index(broader)
+    print("Built ancestor index for", len(vocab), "descriptors with",
+          len(indices), "ancestor relationships")
+    save_index(args.output, vocab, indptr, indices)
+
+    if args.expand:
+        in_csv, out_csv = args.expand
+        index = MeshAncestors(args.output)
+        df = pd.read_csv(in_csv)
+        column = args.column or df.columns[1]
+        df_expanded = index.expand_annotations(df, column=column)
+        print("Expanded", len(df), "annotations to", len(df_expanded))
+        df_expanded.to_csv(out_csv, index=False)
+
+
+if __name__ == '__main__':
+    main()
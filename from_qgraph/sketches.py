@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bounded-memory, mergeable summaries of value counts for high-cardinality
+fields: Space-Saving for the top-k values and HyperLogLog for the number of
+distinct values. Summaries of different files (or processes) can be merged,
+hashing is deterministic across processes.
+"""
+import heapq
+import math
+from hashlib import blake2b
+
+
+def hash64(item):
+    """ Process-independent 64 bit hash of a string """
+    return int.from_bytes(blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class SpaceSaving:
+    """ Approximate counts of the (at most) `k` most frequent items.
+    Counts are overestimated by at most `errors[item]`; every item occurring
+    more than total/k times is kept. """
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        # Min-heap of (count, item), may contain outdated entries
+        self.heap = []
+
+    def _push(self, item):
+        heapq.heappush(self.heap, (self.counts[item], item))
+        if len(self.heap) > 4 * self.k:
+            # Drop outdated entries
+            self.heap = [(count, item) for item, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def _pop_min(self):
+        """ Remove and return the monitored item with the smallest count """
+        while True:
+            count, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                del self.counts[item]
+                return item, count, self.errors.pop(item)
+
+    def min_count(self):
+        """ Upper bound for the count of any item not monitored """
+        if len(self.counts) < self.k:
+            return 0
+        while True:
+            count, item = self.heap[0]
+            if self.counts.get(item) == count:
+                return count
+            heapq.heappop(self.heap)
+
+    def add(self, item, count=1, error=0):
+        if item in self.counts:
+            self.counts[item] += count
+            self.errors[item] += error
+        elif len(self.counts) < self.k:
+            self.counts[item] = count
+            self.errors[item] = error
+        else:
+            __, min_count, __ = self._pop_min()
+            # The new item may have occurred up to min_count times before
+            self.counts[item] = min_count + count
+            self.errors[item] = min_count + error
+        self._push(item)
+
+    def merge(self, other):
+        """ Add the counts of summary `other`. Items monitored by only one of
+        the summaries get the other's bound for unmonitored items added. """
+        own_min, other_min = self.min_count(), other.min_count()
+        counts, errors = {}, {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, own_min) + other.counts.get(item, other_min)
+            errors[item] = self.errors.get(item, own_min) + other.errors.get(item, other_min)
+        top = heapq.nlargest(self.k, counts, key=counts.get)
+        self.counts = {item: counts[item] for item in top}
+        self.errors = {item: errors[item] for item in top}
+        self.heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def most_common(self, n=None):
+        """ (item, approximate count) pairs, most frequent first """
+        items = sorted(self.counts.items(), key=lambda pair: pair[1], reverse=True)
+        return items if n is None else items[:n]
+
+
+class HyperLogLog:
+    """ Approximate number of distinct items with 2^p registers,
+    standard error about 1.04 / sqrt(2^p) """
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, item):
+        x = hash64(item)
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        # Position of the first 1 bit in the remaining 64 - p bits
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __len__(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small range correction: linear counting
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class ApproximateCounter:
+    """ Counter replacement with bounded memory: exact total, approximate
+    number of distinct items and top-k. Like Counter.update, `update` takes
+    an iterable of items or another ApproximateCounter to merge. """
+    def __init__(self, k=1000, p=14):
+        self.top = SpaceSaving(k)
+        self.distinct = HyperLogLog(p)
+        self.num_items = 0
+
+    def update(self, items):
+        if isinstance(items, ApproximateCounter):
+            self.top.merge(items.top)
+            self.distinct.merge(items.distinct)
+            self.num_items += items.num_items
+            return
+        for item in items:
+            self.top.add(item)
+            self.distinct.add(item)
+            self.num_items += 1
+
+    def __len__(self):
+        return len(self.distinct)
+
+    def total(self):
+        return self.num_items
+
+    def most_common(self, n=None):
+        return self.top.most_common(n)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers for querying the ZB MED Knowledge Environment Solr index.
+Requests go through a requests session (see fetching.make_session),
+so any Solr-compatible server can be used via its base url.
+"""
+KE_SOLR_URL = 'http://134.95.56.177:8080/solr/default'
+
+
+def solr_quote(value):
+    """ Quote a value as Solr phrase, e.g. for DOIs with special characters """
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def or_query(field, values):
+    """ Query matching any of `values` in `field` """
+    return '{}:({})'.format(field, ' OR '.join(solr_quote(v) for v in values))
+
+
+def solr_select(session, solr_url, params, timeout=60):
+    """ Send a select request (as POST, so long queries fit) and return the decoded response """
+    ret = session.post(solr_url.rstrip('/') + '/select',
+                       data={**params, 'wt': 'json'}, timeout=timeout)
+    ret.raise_for_status()
+    return ret.json()
+
+
+def first_value(value):
+    """ First value of a multi-valued field, the value itself otherwise """
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental parsing of SRU searchRetrieve responses (ZB MED KE / LIVIVO).
+
+Records are visited one at a time via iterparse and cleared afterwards,
+so memory per file stays constant regardless of the number of records.
+Files may be gzip-compressed (*.gz).
+"""
+import gzip
+import xml.etree.ElementTree as ET
+
+
+class SRUFormatError(ValueError):
+    """ Raised if a file is not an SRU searchRetrieveResponse """
+
+
+def localname(tag):
+    """ Strip namespace ('{uri}record') or prefix ('zs:record') from a tag """
+    return tag.rsplit('}', 1)[-1].rsplit(':', 1)[-1]
+
+
+def open_xml(path):
+    """ Open (possibly gzipped) xml file in binary mode,
+    file objects are returned as they are """
+    if hasattr(path, 'read'):
+        return path
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def find_child(elem, name):
+    """ First direct child of `elem` with local name `name`, else None """
+    if elem is None:
+        return None
+    for child in elem:
+        if localname(child.tag) == name:
+            return child
+    return None
+
+
+def element_text(elem):
+    """ Stripped text of an element, None if empty (like xmltodict) """
+    if elem.text is None:
+        return None
+    text = elem.text.strip()
+    return text if text else None
+
+
+def doc_keys(doc):
+    """ Distinct field names present in a doc """
+    return list(dict.fromkeys(localname(child.tag) for child in doc))
+
+
+def doc_fields(doc, fields=None):
+    """ Materialize fields of a doc as dict (all fields if `fields` is None).
+    Present but empty fields map to None. """
+    obj = {}
+    for child in doc:
+        key = localname(child.tag)
+        if fields is not None and key not in fields:
+            continue
+        if key not in obj:
+            obj[key] = element_text(child)
+    return obj
+
+
+def iter_sru_records(path):
+    """ Iterate over the records of an SRU searchRetrieveResponse file
+    (path or binary file object).
+    Yields the `doc` element inside each record's recordData, or None if
+    a record has no such element. The yielded element is only valid until
+    the next iteration step. Raises SRUFormatError if the file is not an
+    SRU searchRetrieveResponse. """
+    with open_xml(path) as xmlfile:
+        depth = 0
+        records = None
+        for event, elem in ET.iterparse(xmlfile, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 1 and localname(elem.tag) != 'searchRetrieveResponse':
+                    raise SRUFormatError(f"'{path}' is not a searchRetrieveResponse")
+                if depth == 2 and localname(elem.tag) == 'records':
+                    records = elem
+                continue
+            depth -= 1
+            if depth == 1 and elem is records:
+                records = None
+            elif depth == 2 and records is not None and localname(elem.tag) == 'record':
+                yield find_child(find_child(elem, 'recordData'), 'doc')
+                # Drop processed records
+                records.clear()
+
+
+def number_of_records(path):
+    """ Total number of records reported by an SRU searchRetrieveResponse """
+    with open_xml(path) as xmlfile:
+        for __, elem in ET.iterparse(xmlfile):
+            if localname(elem.tag) == 'numberOfRecords':
+                return int(elem.text)
+    raise SRUFormatError(f"'{path}' has no numberOfRecords")
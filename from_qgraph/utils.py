@@ -1,7 +1,32 @@
 """ Utility functions for (multiple) harvesting scripts """
+import sys
+from functools import lru_cache
 
+import pandas as pd
 
+# Number of distinct MeSH terms whose normalized form is kept in memory
+MESH_CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=MESH_CACHE_SIZE)
 def strip_mesh_qualifier(meshterm):
     """ Strip off qualifier terms from mesh terms,
-    which are usually appended with a slash '/' """
-    return meshterm.split('/')[0].strip()
+    which are usually appended with a slash '/'.
+    Results are cached and interned, so repeated terms share memory. """
+    return sys.intern(meshterm.split('/')[0].strip())
+
+
+def strip_qualifier_terms(meshterms):
+    """
+    Strip qualifier term(s) from meshterm that were appended via '/'.
+    The result contains each mesh term only once, in order of first occurrence.
+    """
+    return list(dict.fromkeys(strip_mesh_qualifier(t) for t in meshterms))
+
+
+def strip_qualifier_column(values):
+    """ Strip qualifier terms from a column (pd.Series) of mesh terms.
+    Each distinct value is normalized only once, missing values are kept. """
+    codes, uniques = pd.factorize(values)
+    stripped = pd.Index(uniques).map(strip_mesh_qualifier).take(codes)
+    return pd.Series(stripped, index=values.index, name=values.name).where(codes >= 0)
@@ -11,40 +11,35 @@ Last Change: Mon Oct 21 2019 -- 16:16
 """
 
 import argparse
+import importlib.util
 import os
 import zipfile
 import json
 
-import jsonlines
 from tqdm import tqdm
 
+from from_qgraph.abstract_store import AbstractStoreWriter
+from from_qgraph.jsonl_reader import JSON_DECODERS, LinePrefilter, iter_jsonl, map_jsonl
+from from_qgraph.utils import strip_qualifier_terms
 
-def strip_mesh_qualifier(meshterm):
-    """ Strip off qualifier terms from mesh terms,
-    which are usually appended with a slash '/' """
-    return meshterm.split('/')[0].strip()
 
-
-def strip_qualifier_terms(meshterms):
-    """
-    Strip qualifier term(s) from meshterm that were appended via '/'.
-    The result contains each mesh term only once.
-    """
-    return list(set(strip_mesh_qualifier(t) for t in meshterms))
-
-
-def harvest_lines(lines_iter, min_year=None, filter_language=None, limit=None):
-    json = jsonlines.Reader(lines_iter)
-    # flat_gen = ((d['_id']['$oid'], d['liv']['orig_data']) for d in json)
-    flat_gen = (d['liv']['orig_data'] for d in json)
-
-    doi2mesh = {}
-    doi2title = {}
-    doi2abstract = {}
+def iter_papers(lines_iter, min_year=None, filter_language=None, limit=None,
+                progress=True, decoder='auto', prefilter=True):
+    """ Yields (doi, meshterms, title, abstract) of each harvested paper """
+    line_filter = None
+    if prefilter:
+        # Skip decoding lines that cannot pass the filters below
+        line_filter = LinePrefilter(
+            required=['sortyear', 'MESH', 'DOI', 'TITLE', 'ABSTRACT']
+            + ([filter_language] if filter_language else []),
+            min_year=min_year)
+    records = iter_jsonl(lines_iter, decoder=decoder, prefilter=line_filter)
+    # flat_gen = ((d['_id']['$oid'], d['liv']['orig_data']) for d in records)
+    flat_gen = (d['liv']['orig_data'] for d in records)
 
     n_extracted = 0
 
-    for data in tqdm(flat_gen):
+    for data in tqdm(flat_gen, disable=not progress):
         # Do not exceed limit
         if limit and n_extracted > limit:
             break
@@ -88,14 +83,102 @@ def harvest_lines(lines_iter, min_year=None, filter_language=None, limit=None):
         abstract = data["ABSTRACT"][0]
 
 
-        doi2mesh[doi] = meshterms
-        doi2title[doi] = title
-        doi2abstract[doi] = abstract
+        yield doi, meshterms, title, abstract
 
         n_extracted += 1
-    print("Harvested metadata of %d papers" % n_extracted)
 
-    return doi2mesh, doi2title, doi2abstract
+
+def harvest_rows(lines_iter, **kwargs):
+    """ List of harvested papers, see `iter_papers` """
+    return list(iter_papers(lines_iter, **kwargs))
+
+
+def iter_input_papers(path, n_jobs=1, batch_size=10000, **kwargs):
+    """ Yields harvested papers of (possibly zipped) jsonl file at `path` in input order,
+    parsed in `n_jobs` processes """
+    if n_jobs != 1 and kwargs.get('limit') is None:
+        for rows in map_jsonl(harvest_rows, path, n_jobs=n_jobs, batch_size=batch_size,
+                              lazy=True, progress=False, **kwargs):
+            yield from rows
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path, 'r') as zip_archive:
+            # assume zip archive has only one file
+            with zip_archive.open(zip_archive.infolist()[0]) as input_file:
+                yield from iter_papers(input_file, **kwargs)
+    else:
+        with open(path, 'rb') as input_file:
+            yield from iter_papers(input_file, **kwargs)
+
+
+class JsonlPaperWriter:
+    """ Writes one json object per paper and line """
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, row):
+        self.file.write(json.dumps(row) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetPaperWriter:
+    """ Writes papers as parquet file, one row group per `batch_size` papers """
+    def __init__(self, path, with_abstract=True, batch_size=10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        fields = [('doi', pa.string()), ('mesh', pa.list_(pa.string())), ('title', pa.string())]
+        if with_abstract:
+            fields.append(('abstract', pa.string()))
+        self.pa = pa
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.batch_size = batch_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def stream_papers(papers, outdir, output_format, abstract_store=False):
+    """ Write each paper as soon as it is harvested. Only the first occurrence
+    of a DOI is kept. With `abstract_store`, abstracts are written to a compact
+    store (see from_qgraph/abstract_store.py) instead of the paper rows. """
+    path = os.path.join(outdir, 'papers.' + output_format)
+    if output_format == 'parquet':
+        writer = ParquetPaperWriter(path, with_abstract=not abstract_store)
+    else:
+        writer = JsonlPaperWriter(path)
+    store = AbstractStoreWriter(os.path.join(outdir, 'abstracts')) if abstract_store else None
+    seen = set()
+    try:
+        for doi, meshterms, title, abstract in papers:
+            if doi in seen:
+                continue
+            seen.add(doi)
+            row = {'doi': doi, 'mesh': meshterms, 'title': title}
+            if store is not None:
+                store.add(doi, abstract)
+            else:
+                row['abstract'] = abstract
+            writer.write(row)
+    finally:
+        writer.close()
+        if store is not None:
+            store.close()
+    print("Harvested metadata of %d papers" % len(seen))
+
 
 def main():
     """ Extracts separate tables from jsonlines file """
@@ -110,36 +193,61 @@ def main():
                         help="Parse fewer lines to create a debugging dataset")
     parser.add_argument("--min-year", default=None, type=int,
                         help="Keep only those papers with year >= min_year")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes for parsing (-1 for all cores)")
+    parser.add_argument("--batch-size", type=int, default=10000,
+                        help="Lines per batch handed to workers for zipped input")
+    parser.add_argument("--json-decoder", choices=JSON_DECODERS, default='auto',
+                        help="JSON decoder, 'auto' uses the fastest available")
+    parser.add_argument("--no-prefilter", dest='prefilter', default=True, action='store_false',
+                        help="Decode all lines instead of skipping lines that cannot pass the filters")
+    parser.add_argument("--format", choices=['json', 'jsonl', 'parquet'], default='json',
+                        help="json: doi2mesh/doi2title/doi2abstract dicts, "
+                        "jsonl/parquet: stream one row per paper into papers.{jsonl,parquet}. "
+                        "All formats keep the first paper of a duplicate DOI")
+    parser.add_argument("--abstract-store", default=False, action='store_true',
+                        help="With jsonl/parquet: write abstracts to a compressed blob "
+                        "with offset index (abstracts.*) instead of the paper rows")
     args = parser.parse_args()
+    if args.format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        parser.error("--format parquet requires pyarrow")
 
     kwargs = {
         'limit': args.limit,
         'filter_language': args.filter_language,
-        'min_year': args.min_year
+        'min_year': args.min_year,
+        'decoder': args.json_decoder,
+        'prefilter': args.prefilter
     }
 
-    if zipfile.is_zipfile(args.jsonl_file):
-        with zipfile.ZipFile(args.jsonl_file, 'r') as zip_archive:
-            # assume zip archive has only one file
-            with zip_archive.open(zip_archive.infolist()[0]) as input_file:
-                doi2mesh, doi2title, doi2abstract = harvest_lines(input_file, **kwargs)
+    papers = iter_input_papers(args.jsonl_file, n_jobs=args.jobs,
+                               batch_size=args.batch_size, **kwargs)
+    os.makedirs(args.save, exist_ok=True)
+    if args.format != 'json':
+        stream_papers(papers, args.save, args.format, abstract_store=args.abstract_store)
     else:
-        with open(args.jsonl_file, 'r') as input_file:
-            doi2mesh, doi2title, doi2abstract = harvest_lines(input_file, **kwargs)
+        doi2mesh, doi2title, doi2abstract = {}, {}, {}
+        for doi, meshterms, title, abstract in papers:
+            if doi in doi2mesh:
+                # Keep the first occurrence, as the streaming writers do
+                continue
+            doi2mesh[doi] = meshterms
+            doi2title[doi] = title
+            doi2abstract[doi] = abstract
+        print("Harvested metadata of %d papers" % len(doi2mesh))
 
-    # List of (File name w/o extension, dictionary to save)
-    output_data = [
-        ('doi2mesh', doi2mesh),
-        ('doi2title', doi2title),
-        ('doi2abstract', doi2abstract)
-    ]
+        # List of (File name w/o extension, dictionary to save)
+        output_data = [
+            ('doi2mesh', doi2mesh),
+            ('doi2title', doi2title),
+            ('doi2abstract', doi2abstract)
+        ]
 
-    # Dumps everything to disk
-    os.makedirs(args.save, exist_ok=True)
-    for fname, output_dict in output_data:
-        path = os.path.join(args.save, fname + '.json')
-        with open(path, 'w') as json_file:
-            json.dump(output_dict, json_file)
+        # Dumps everything to disk
+        for fname, output_dict in output_data:
+            path = os.path.join(args.save, fname + '.json')
+            with open(path, 'w') as json_file:
+                json.dump(output_dict, json_file)
     with open(os.path.join(args.save, 'args.txt'), 'w') as args_file:
         print(args, file=args_file)
 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Map MeSH identifiers of preprint annotations (http://id.nlm.nih.gov/mesh/D...)
+to MeSH descriptor names and tree numbers, replacing mesh_identifiers.R.
+
+The MeSH descriptor files (desc*.xml, possibly gzipped) are streamed once into
+a lookup table (descriptor, DescriptorName, TreeNumberList), which can be
+saved with --lookup and reused in later runs without the xml files.
+Multiple tree numbers are joined with ';'.
+
+    python3 mesh_identifiers.py annotation_unmapped.csv annotation_mapped.csv --desc desc2020.xml --lookup mesh_lookup.csv
+    python3 mesh_identifiers.py annotation_unmapped.csv annotation_mapped.csv --lookup mesh_lookup.csv
+"""
+import argparse
+import csv
+import gzip
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+MESH_PREFIX = "http://id.nlm.nih.gov/mesh/"
+LOOKUP_COLUMNS = ['descriptor', 'DescriptorName', 'TreeNumberList']
+
+
+def open_xml(path):
+    """ Open (possibly gzipped) xml file in binary mode """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def child_text(elem, path):
+    """ Text of the first element at `path` below `elem`, None if missing """
+    child = elem.find(path)
+    if child is None or child.text is None:
+        return None
+    return child.text.strip()
+
+
+def iter_descriptors(path):
+    """ Yields (DescriptorUI, DescriptorName, TreeNumberList) of each
+    DescriptorRecord in a MeSH descriptor xml file. Only direct children of the
+    record are used, not the descriptors referred to within the record. """
+    with open_xml(path) as xmlfile:
+        context = ET.iterparse(xmlfile, events=('start', 'end'))
+        __event, root = next(context)
+        for event, elem in context:
+            if event != 'end' or elem.tag != 'DescriptorRecord':
+                continue
+            tree_numbers = [tn.text.strip() for tn in elem.iterfind('TreeNumberList/TreeNumber')
+                            if tn.text]
+            yield (child_text(elem, 'DescriptorUI'),
+                   child_text(elem, 'DescriptorName/String'),
+                   ';'.join(tree_numbers) if tree_numbers else None)
+            # Drop processed records
+            root.clear()
+
+
+def build_lookup(desc_files):
+    """ Lookup table of descriptors from MeSH descriptor xml files,
+    later files take precedence """
+    rows = [row for path in desc_files for row in iter_descriptors(path)]
+    df_lookup = pd.DataFrame(rows, columns=LOOKUP_COLUMNS)
+    return df_lookup.drop_duplicates(subset='descriptor', keep='last')
+
+
+def map_annotations(df_annotation, df_lookup, column='concept'):
+    """ Map MeSH identifiers in `column` to descriptor names and tree numbers.
+    Identifiers without descriptor (e.g. qualifiers or supplementary concepts)
+    are dropped. Returns paper_id, DescriptorName, TreeNumberList. """
+    df = df_annotation.assign(
+        subject=df_annotation[column].str.replace(MESH_PREFIX, '', regex=False))
+    df = df.merge(df_lookup, left_on='subject', right_on='descriptor', how='inner')
+    df = df.dropna(subset=['DescriptorName'])
+    df = df.drop_duplicates(subset=['subject', 'paper_id', 'DescriptorName', 'TreeNumberList'])
+    return df[['paper_id', 'DescriptorName', 'TreeNumberList']]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('annotation_unmapped',
+                        help="Annotations with MeSH identifiers (columns paper_id, concept)")
+    parser.add_argument('annotation_mapped', help="Output csv file")
+    parser.add_argument('--desc', nargs='+', default=None,
+                        help="MeSH descriptor xml files (desc*.xml, may be gzipped)")
+    parser.add_argument('--lookup', default=None,
+                        help="Lookup table csv: written if --desc is given, read otherwise")
+    parser.add_argument('--column', default='concept',
+                        help="Column with MeSH identifiers")
+    args = parser.parse_args()
+
+    if args.desc:
+        print("Reading descriptors from", args.desc)
+        df_lookup = build_lookup(args.desc)
+        if args.lookup:
+            df_lookup.to_csv(args.lookup, index=False)
+    elif args.lookup:
+        df_lookup = pd.read_csv(args.lookup, dtype=str)
+    else:
+        parser.error("Either --desc or --lookup is required")
+    print("Lookup table has", len(df_lookup), "descriptors")
+
+    df_annotation = pd.read_csv(args.annotation_unmapped, dtype=str)
+    df_mapped = map_annotations(df_annotation, df_lookup, column=args.column)
+    print("Mapped", len(df_mapped), "of", len(df_annotation), "annotations")
+    df_mapped.to_csv(args.annotation_mapped, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 import argparse
+import multiprocessing
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
 # List of date formats. Important: this has to go from more precise to less
@@ -16,6 +20,13 @@ OUTPUT_DATE_COLUMN_NAME = 'publdate'
 # Print debug info
 DEBUG = True
 
+# Regular expressions used by datetime.strptime for the directives we need
+STRPTIME_DIRECTIVES = {
+    'Y': r"(?P<Y>\d\d\d\d)",
+    'm': r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    'd': r"(?P<d>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])",
+}
+
 def precision_of_date_format(date_format):
     """ Analyze date format for its precision:
     Returns: 3 if the format contains year, month, and day.
@@ -74,9 +85,174 @@ def preferred_date(date_a_str: str, date_b_str: str) -> str:
         print(date_a_str, '|', date_b_str, '->', min_date_str)
     return min_date_str
 
+def date_format_regex(date_format: str) -> str:
+    """ Translate a date format into a regex that accepts the same strings
+    as datetime.strptime (only %Y, %m, %d are supported) """
+    pattern = re.sub(r"([\\.^$*+?\(\){}\[\]|])", r"\\\1", date_format)
+    pattern = re.sub(r"\s+", lambda __m: r"\s+", pattern)
+    pattern = re.sub(r"%([Ymd])", lambda m: STRPTIME_DIRECTIVES[m.group(1)], pattern)
+    return "^" + pattern + r"\Z"
+
+
+def convert_date_column(values, date_formats:[str]=INPUT_DATE_FORMATS):
+    """ Vectorized version of `convert_date` for a whole column.
+    Returns: (dates as datetime64[D] array with NaT for no match, precision array) """
+    values = pd.Series(values).reset_index(drop=True).map(str)
+    dates = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[D]')
+    precision = np.zeros(len(values), dtype=np.int8)
+    todo = np.arange(len(values))
+    for date_format in date_formats:
+        if not len(todo):
+            break
+        parts = values.iloc[todo].str.extract(date_format_regex(date_format), flags=re.IGNORECASE)
+        matched = parts.iloc[:, 0].notna().to_numpy()
+        parts = parts[matched]
+        # Fields missing in the format default to 1, like in strptime
+        year, month, day = (parts[key].map(int).to_numpy(dtype=np.int64) if key in parts
+                            else np.ones(len(parts), dtype=np.int64)
+                            for key in 'Ymd')
+        months = ((year - 1970) * 12 + (month - 1)).astype('datetime64[M]')
+        candidates = months.astype('datetime64[D]') + (day - 1)
+        # strptime raises ValueError for invalid days (e.g., Feb 30) and year 0,
+        # in which case the next format is tried
+        valid = (year >= 1) & (candidates.astype('datetime64[M]') == months)
+        hits = todo[matched][valid]
+        dates[hits] = candidates[valid]
+        precision[hits] = precision_of_date_format(date_format)
+        todo = np.setdiff1d(todo, hits, assume_unique=True)
+    return dates, precision
+
+
+def format_date_column(dates) -> np.ndarray:
+    """ Vectorized `strftime(OUTPUT_DATE_FORMAT)`, empty string for NaT """
+    formatted = np.datetime_as_string(dates, unit='D').astype(object)
+    # strftime does not zero-pad years below 1000, numpy does
+    for i in np.flatnonzero(~np.isnat(dates) & (dates < np.datetime64('1000-01-01'))):
+        formatted[i] = dates[i].item().strftime(OUTPUT_DATE_FORMAT)
+    formatted[np.isnat(dates)] = ""
+    return formatted
+
+
+class DateMemo:
+    """ Memo of already parsed date strings: string -> (datetime64[D], precision).
+    May be backed by a dict shared between processes (e.g. multiprocessing.Manager().dict()),
+    which is synchronized in bulk via `refresh` and `flush`. """
+    def __init__(self, shared=None):
+        self.local = {}
+        self.pending = {}
+        self.shared = shared
+        if shared is not None:
+            self.refresh()
+
+    def refresh(self):
+        """ Pull entries parsed by other processes """
+        if self.shared is not None:
+            self.local.update(self.shared.copy())
+
+    def flush(self):
+        """ Push entries parsed since the last flush """
+        if self.shared is not None and self.pending:
+            self.shared.update(self.pending)
+        self.pending.clear()
+
+    def __len__(self):
+        return len(self.local)
+
+    def convert(self, values):
+        """ Like `convert_date_column`, but parses each distinct string only once """
+        codes, uniques = pd.factorize(pd.Series(values).reset_index(drop=True).map(str))
+        new = [value for value in uniques if value not in self.local]
+        if new:
+            dates, precision = convert_date_column(new)
+            parsed = dict(zip(new, zip(dates, precision)))
+            self.local.update(parsed)
+            self.pending.update(parsed)
+        known = [self.local[value] for value in uniques]
+        unique_dates = np.array([date for date, __prec in known], dtype='datetime64[D]')
+        unique_precision = np.array([prec for __date, prec in known], dtype=np.int8)
+        return unique_dates[codes], unique_precision[codes]
+
+
+def parse_date_column(values, memo: DateMemo = None) -> np.ndarray:
+    """ Vectorized version of `parse_date` """
+    convert = convert_date_column if memo is None else memo.convert
+    dates, __prec = convert(values)
+    return format_date_column(dates)
+
+
+def preferred_date_column(values_a, values_b, memo: DateMemo = None) -> np.ndarray:
+    """ Vectorized version of `preferred_date` """
+    convert = convert_date_column if memo is None else memo.convert
+    dates_a, prec_a = convert(values_a)
+    dates_b, prec_b = convert(values_b)
+    # Same precision -> earlier date, else the more precise one
+    # (both NaT only if no date could be found in either string)
+    dates = np.where(prec_a == prec_b, np.minimum(dates_a, dates_b),
+                     np.where(prec_a > prec_b, dates_a, dates_b))
+    return format_date_column(dates)
+
+
+def resolve_dates(df, date_columns, engine='vectorized', memo=None):
+    """ Resolve one or two date columns of `df` into a single date column """
+    if len(date_columns) == 2:
+        sub_df = df[date_columns]
+        if engine == 'vectorized':
+            return preferred_date_column(sub_df.iloc[:, 0], sub_df.iloc[:, 1], memo=memo)
+        return sub_df.apply(lambda row: preferred_date(row.iloc[0], row.iloc[1]), axis=1, result_type='reduce')
+    col = date_columns[0]
+    if engine == 'vectorized':
+        return parse_date_column(df[col], memo=memo)
+    return df[col].map(parse_date)
+
+
+def resolve_file(input, output, date_columns, engine='vectorized', keep_old_columns=False,
+                 chunksize=None, memo=None):
+    """ Resolve dates of csv file `input` and write the result to `output` (if not None).
+    With `chunksize`, the input is streamed in chunks that are appended to the output. """
+    if chunksize:
+        chunks = pd.read_csv(input, chunksize=chunksize)
+    else:
+        chunks = [pd.read_csv(input)]
+    num_rows = 0
+    for i, df in enumerate(chunks):
+        if DEBUG and i == 0:
+            print(df[date_columns].head())
+        publdate = resolve_dates(df, date_columns, engine=engine, memo=memo)
+        if not keep_old_columns:
+            df.drop(date_columns, axis=1, inplace=True)
+        df[OUTPUT_DATE_COLUMN_NAME] = publdate
+        if output:
+            df.to_csv(output, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+        if memo is not None:
+            memo.flush()
+        num_rows += len(df)
+    return num_rows
+
+
+# Memo of the current worker process, see `_init_worker`
+_WORKER_MEMO = None
+
+
+def _init_worker(shared_memo):
+    global _WORKER_MEMO
+    _WORKER_MEMO = DateMemo(shared_memo)
+
+
+def _resolve_file_in_worker(input, output, **kwargs):
+    _WORKER_MEMO.refresh()
+    return input, resolve_file(input, output, memo=_WORKER_MEMO, **kwargs)
+
+
+def output_path_for(input, output_dir, suffix):
+    """ Output path in `output_dir` for multi-input mode: name_SUFFIX.csv """
+    stem, ext = os.path.splitext(os.path.basename(input))
+    return os.path.join(output_dir, stem + suffix + (ext or '.csv'))
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('input', help="Input csv file")
+    parser.add_argument('input', nargs='+',
+            help="Input csv file(s). With multiple files, -o/--output is a directory.")
     parser.add_argument('--input_date_columns', nargs='+',
             default=DEFAULT_INPUT_DATE_COLUMN_NAMES,
             help="Specify date columns to parse, may be one or two")
@@ -85,35 +261,60 @@ def main():
             help="Do *not* drop the old columns in the output.")
     parser.add_argument('-o', '--output', default=None,
             help="Path to write output")
+    parser.add_argument('--engine', choices=['vectorized', 'rowwise'],
+            default='vectorized',
+            help="Parse whole columns at once or row by row")
+    parser.add_argument('--chunksize', type=int, default=None,
+            help="Stream input in chunks of this many rows and append them to the output")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help="Number of processes for resolving multiple input files")
+    parser.add_argument('--suffix', default='_DATEFIX',
+            help="Suffix of output file names in multi-input mode")
     args = parser.parse_args()
+    if len(args.input_date_columns) not in (1, 2):
+        parser.error(f"Invalid number of input date columns: {args.input_date_columns}")
+
+    multi_input = len(args.input) > 1
     if args.output is None:
         print("No -o/--output given -> DRY RUN")
+        outputs = [None] * len(args.input)
+    elif multi_input:
+        os.makedirs(args.output, exist_ok=True)
+        outputs = [output_path_for(path, args.output, args.suffix) for path in args.input]
     else:
-        if os.path.exists(args.output):
-            answer = input(f"Output path exists: Overwrite '{args.output}' y/n?")
+        outputs = [args.output]
+
+    for output in outputs:
+        if output and os.path.exists(output):
+            answer = input(f"Output path exists: Overwrite '{output}' y/n?")
             if not answer.startswith('y'):
                 exit(1)
 
-    df = pd.read_csv(args.input)
-    if len(args.input_date_columns) == 2:
-        sub_df = df[args.input_date_columns]
-        if DEBUG:
-            print(sub_df.head())
-        publdate = sub_df.apply(lambda row: preferred_date(row[0], row[1]), axis=1, result_type='reduce')
-    elif len(args.input_date_columns) == 1:
-        col = args.input_date_columns[0]
-        publdate = df[col].map(parse_date)
-    else:
-        print("Invalid number of input date columns:", args.input_date_columns)
+    kwargs = {
+        'date_columns': args.input_date_columns,
+        'engine': args.engine,
+        'keep_old_columns': args.keep_old_columns,
+        'chunksize': args.chunksize
+    }
 
-    if not args.keep_old_columns:
-        df.drop(args.input_date_columns, axis=1, inplace=True)
-    df[OUTPUT_DATE_COLUMN_NAME] = publdate
+    if args.jobs > 1 and multi_input:
+        with multiprocessing.Manager() as manager:
+            shared_memo = manager.dict()
+            with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                                     initargs=(shared_memo,)) as pool:
+                futures = [pool.submit(_resolve_file_in_worker, path, output, **kwargs)
+                           for path, output in zip(args.input, outputs)]
+                for future, output in zip(futures, outputs):
+                    path, num_rows = future.result()
+                    print(f"Resolved {num_rows} rows of '{path}'", f"-> '{output}'" if output else "")
+            print("Distinct date strings parsed:", len(shared_memo))
+    else:
+        memo = DateMemo()
+        for path, output in zip(args.input, outputs):
+            num_rows = resolve_file(path, output, memo=memo, **kwargs)
+            print(f"Resolved {num_rows} rows of '{path}'", f"-> '{output}'" if output else "")
+        print("Distinct date strings parsed:", len(memo))
 
-    if args.output:
-        print("Writing output to", args.output)
-        df.to_csv(args.output, index=False)
-    # df['publdate'] = resolve_date
 
 if __name__ == '__main__':
     main()
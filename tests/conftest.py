@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Root scripts import from_qgraph as a package, its modules import their siblings directly
+for path in [ROOT, os.path.join(ROOT, 'from_qgraph'), os.path.join(ROOT, 'covid19')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
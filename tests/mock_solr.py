@@ -0,0 +1,134 @@
+"""
+Minimal in-process stand-in for the KE Solr /select handler, for tests.
+
+Supports the queries the harvesters send: '*:*', FIELD:"value",
+FIELD:("a" OR "b"), -FIELD:[* TO *] and FIELD:[a TO *] / FIELD:{a TO *],
+joined by AND, in q and fq. Further: rows/start, fl, facet.field and
+json.facet query facets with terms sub-facets. Set `fail` to a predicate
+on the request parameters to answer matching requests with HTTP 500.
+"""
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+PHRASE = r'"(?:[^"\\]|\\.)*"'
+
+
+def unquote(phrase):
+    return re.sub(r'\\(.)', r'\1', phrase[1:-1])
+
+
+def field_values(doc, field):
+    value = doc.get(field)
+    if value is None:
+        return []
+    return [str(v) for v in value] if isinstance(value, list) else [str(value)]
+
+
+def match_clause(doc, clause):
+    if clause == '*:*':
+        return True
+    m = re.fullmatch(r'-(\w+):\[\* TO \*\]', clause)
+    if m:
+        return not field_values(doc, m.group(1))
+    m = re.fullmatch(r'(\w+):([\[{])(' + PHRASE + r') TO \*\]', clause)
+    if m:
+        bound = unquote(m.group(3))
+        return any(v >= bound if m.group(2) == '[' else v > bound
+                   for v in field_values(doc, m.group(1)))
+    m = re.fullmatch(r'(\w+):(' + PHRASE + ')', clause)
+    if m:
+        return unquote(m.group(2)) in field_values(doc, m.group(1))
+    m = re.fullmatch(r'(\w+):\((.*)\)', clause)
+    if m:
+        wanted = {unquote(v) for v in re.findall(PHRASE, m.group(2))}
+        return bool(wanted & set(field_values(doc, m.group(1))))
+    raise ValueError(f"Unsupported query clause: {clause}")
+
+
+def match(doc, query):
+    return all(match_clause(doc, clause) for clause in query.split(' AND '))
+
+
+def terms_facet(docs, spec):
+    counts = {}
+    for doc in docs:
+        for value in field_values(doc, spec['field']):
+            counts[value] = counts.get(value, 0) + 1
+    buckets = [{'val': value, 'count': count} for value, count
+               in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+               if count >= spec.get('mincount', 1)]
+    limit = spec.get('limit', 10)
+    return {'buckets': buckets if limit < 0 else buckets[:limit]}
+
+
+def json_facets(docs, facets):
+    result = {'count': len(docs)}
+    for name, spec in facets.items():
+        if spec['type'] == 'query':
+            subset = [doc for doc in docs if match(doc, spec['q'])]
+            result[name] = json_facets(subset, spec.get('facet', {}))
+        elif spec['type'] == 'terms':
+            result[name] = terms_facet(docs, spec)
+    return result
+
+
+class MockSolr:
+    """ Serves `docs` on a free local port, use as context manager """
+    def __init__(self, docs):
+        self.docs = docs
+        self.fail = None
+        self.requests = []
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+                params = parse_qs(body)
+                mock.requests.append(params)
+                if mock.fail is not None and mock.fail(params):
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                out = json.dumps(mock.select(params)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/solr/default'.format(self.server.server_port)
+
+    def select(self, params):
+        def get(key, default=None):
+            return params.get(key, [default])[0]
+        docs = [doc for doc in self.docs
+                if match(doc, get('q', '*:*'))
+                and all(match(doc, fq) for fq in params.get('fq', []))]
+        start, rows = int(get('start', 0)), int(get('rows', 10))
+        page = docs[start:start + rows]
+        if get('fl'):
+            fields = get('fl').split(',')
+            page = [{k: v for k, v in doc.items() if k in fields} for doc in page]
+        out = {'response': {'numFound': len(docs), 'start': start, 'docs': page}}
+        if get('facet') == 'true' and get('facet.field'):
+            counts = terms_facet(docs, {'field': get('facet.field'), 'limit': -1})
+            out['facet_counts'] = {'facet_fields': {get('facet.field'): [
+                x for bucket in counts['buckets'] for x in (bucket['val'], bucket['count'])]}}
+        if get('json.facet'):
+            out['facets'] = json_facets(docs, json.loads(get('json.facet')))
+        return out
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,32 @@
+import json
+
+from from_qgraph.abstract_store import AbstractStore, AbstractStoreWriter
+from harvest_doi_mesh_abstract_from_zbmed_jsonl import stream_papers
+
+
+def test_abstract_store_round_trip(tmp_path):
+    prefix = str(tmp_path / 'abstracts')
+    abstracts = {'10.1/1': 'first abstract', '10.1/2': '', '10.1/ü': 'Übersicht ' * 100}
+    with AbstractStoreWriter(prefix) as writer:
+        for doi, abstract in abstracts.items():
+            writer.add(doi, abstract)
+    store = AbstractStore(prefix)
+    assert len(store) == 3
+    assert list(store) == list(abstracts)
+    for doi, abstract in abstracts.items():
+        assert store[doi] == abstract
+    assert '10.1/3' not in store
+    assert store.get('10.1/3') is None
+
+
+def test_stream_papers_keeps_first_duplicate(tmp_path):
+    papers = [('10.1/1', ['A'], 't1', 'abs 1'),
+              ('10.1/2', ['B'], 't2', 'abs 2'),
+              ('10.1/1', ['C'], 't3', 'abs 3')]
+    stream_papers(iter(papers), str(tmp_path), 'jsonl', abstract_store=True)
+    with open(tmp_path / 'papers.jsonl') as fhandle:
+        rows = [json.loads(line) for line in fhandle]
+    assert rows == [{'doi': '10.1/1', 'mesh': ['A'], 'title': 't1'},
+                    {'doi': '10.1/2', 'mesh': ['B'], 'title': 't2'}]
+    store = AbstractStore(str(tmp_path / 'abstracts'))
+    assert dict((doi, store[doi]) for doi in store) == {'10.1/1': 'abs 1', '10.1/2': 'abs 2'}
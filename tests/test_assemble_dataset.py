@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from assemble_dataset import export_csr, to_csr
+
+
+def test_to_csr_deduplicates_pairs():
+    indptr, indices = to_csr([2, 0, 2, 0, 2], [1, 3, 0, 3, 1], (4, 5))
+    assert indptr.tolist() == [0, 1, 1, 3, 3]
+    assert indices.tolist() == [3, 0, 1]
+
+
+def test_export_csr_collapsed_subjects(tmp_path):
+    df_paper = pd.DataFrame({'title': ['a', 'b']}, index=['p1', 'p2'])
+    # Two annotations that collapse to the same descriptor after qualifier stripping
+    df_annotation = pd.DataFrame({'paper_id': ['p1', 'p1', 'p2', 'p3'],
+                                  'subject': ['Lung', 'Lung', 'Virus', 'Lung']})
+    export_csr(str(tmp_path), df_paper, df_annotation=df_annotation)
+    with np.load(tmp_path / 'csr_paper_subject.npz') as npz:
+        assert npz['indptr'].tolist() == [0, 1, 2]
+        assert npz['indices'].tolist() == [0, 1]
+        assert npz['shape'].tolist() == [2, 2]
+    assert (tmp_path / 'vocab_subject.txt').read_text().split() == ['Lung', 'Virus']
@@ -0,0 +1,55 @@
+import gzip
+
+import pytest
+import requests
+
+import fetch_ke_sru
+
+RECORD = b'<zs:record><zs:recordData><doc><id>1</id></doc></zs:recordData></zs:record>'
+RESPONSE = (b'<zs:searchRetrieveResponse xmlns:zs="http://docs.oasis-open.org/ns/search-ws/sruResponse">'
+            b'<zs:numberOfRecords>2</zs:numberOfRecords><zs:records>' + RECORD * 2
+            + b'</zs:records></zs:searchRetrieveResponse>')
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """ Answers requests with `contents` in turn, raising exceptions among them """
+    def __init__(self, *contents):
+        self.contents = list(contents)
+        self.n_requests = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.n_requests += 1
+        content = self.contents.pop(0)
+        if isinstance(content, Exception):
+            raise content
+        return FakeResponse(content)
+
+
+def fetch(session, tmp_path, retries=3):
+    return fetch_ke_sru.fetch_window(session, 'http://sru', 'q', 'user', 1, 2, 2, str(tmp_path),
+                                     retries=retries, backoff=0)
+
+
+def test_fetch_window_retries_truncated_and_incomplete(tmp_path):
+    session = FakeSession(RESPONSE[:-20], RESPONSE.replace(RECORD, b'', 1),
+                          requests.exceptions.ChunkedEncodingError('cut'), RESPONSE)
+    assert fetch(session, tmp_path) == ('window-00000001.xml.gz', 2)
+    assert session.n_requests == 4
+    with gzip.open(tmp_path / 'window-00000001.xml.gz', 'rb') as fhandle:
+        assert fhandle.read() == RESPONSE
+
+
+def test_fetch_window_does_not_retry_http_or_other_errors(tmp_path):
+    for error in (requests.HTTPError('503'), TypeError('bug')):
+        session = FakeSession(error, RESPONSE)
+        with pytest.raises(type(error)):
+            fetch(session, tmp_path)
+        assert session.n_requests == 1
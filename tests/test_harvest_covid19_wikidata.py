@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip('SPARQLWrapper')
+import harvest_covid19_Wikidata as wikidata  # noqa: E402
+
+
+def fake_run_query(max_dois, calls, heavy=()):
+    """ Answers queries for at most `max_dois` DOIs, times out on larger ones
+    and on any query for one of `heavy` """
+    def run_query(query, endpoint=None, retries=None):
+        values = query.split('VALUES ?doi {')[1].split('}')[0]
+        dois = [doi for doi in values.replace('"', ' ').split() if doi]
+        calls.append(dois)
+        if len(dois) > max_dois or set(dois) & set(heavy):
+            raise wikidata.QueryTooHeavy('timeout')
+        return [{'doi': {'value': doi},
+                 'author': {'value': 'http://www.wikidata.org/entity/Q' + doi.rsplit('/', 1)[1]}}
+                for doi in dois]
+    return run_query
+
+
+def test_lookup_batch_splits_heavy_queries(monkeypatch):
+    calls = []
+    monkeypatch.setattr(wikidata, 'run_query', fake_run_query(4, calls))
+    dois = [f'10.1/{i}' for i in range(10)]
+    doi_authors, author_employers = wikidata.lookup_batch(dois)
+    assert doi_authors == {doi: ['Q' + doi.rsplit('/', 1)[1]] for doi in dois}
+    assert author_employers == {'Q' + str(i): [] for i in range(10)}
+    assert len(calls) > 1
+
+
+def test_lookup_batch_keeps_results_beside_failing_doi(monkeypatch):
+    calls = []
+    monkeypatch.setattr(wikidata, 'run_query', fake_run_query(4, calls, heavy=['10.1/7']))
+    dois = [f'10.1/{i}' for i in range(10)]
+    doi_authors, author_employers = wikidata.lookup_batch(dois)
+    assert doi_authors == {doi: ['Q' + doi.rsplit('/', 1)[1]] for doi in dois if doi != '10.1/7'}
+    assert 'Q7' not in author_employers
+    assert ['10.1/7'] in calls
+
+
+def test_lookup_batch_single_doi_timeout(monkeypatch):
+    monkeypatch.setattr(wikidata, 'run_query', fake_run_query(0, []))
+    assert wikidata.lookup_batch(['10.1/1']) == ({}, {})
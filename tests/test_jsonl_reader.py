@@ -0,0 +1,25 @@
+import io
+import json
+
+import pytest
+
+from from_qgraph.jsonl_reader import iter_json_array
+
+
+RECORDS = [12345, -1.5e10, "a string", {"doi": "10.1/x", "n": [1, 22, 333]}, True, None, 7]
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 12))
+def test_iter_json_array_small_chunks(chunk_size):
+    text = json.dumps(RECORDS)
+    assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == RECORDS
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+def test_iter_json_array_number_across_chunks(chunk_size):
+    assert list(iter_json_array(io.StringIO('[12345]'), chunk_size=chunk_size)) == [12345]
+
+
+def test_iter_json_array_truncated():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[1, {"a": '), chunk_size=2))
@@ -0,0 +1,45 @@
+import importlib
+import random
+
+import pandas as pd
+
+from from_qgraph.fetching import make_session
+from mock_solr import MockSolr
+
+ke_solr_harvester = importlib.import_module('KE-solr_harvester')
+
+TERMS = ['Ebolavirus', 'Zika Virus', 'Influenza A Virus, H5N1 Subtype', 'HIV-1', 'Quote "term"']
+
+
+def make_docs(n=400, seed=0):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        doc = {'id': f'r{i:04d}', 'DOI': [f'10.1/{i}'],
+               'MESH': rng.sample(TERMS + ['Humans', 'Mice'], 3)}
+        if i % 37:
+            doc['PUBLYEAR'] = str(rng.randint(1985, 1994))
+        docs.append(doc)
+    return docs
+
+
+def test_count_facets_matches_count_cells():
+    years = [str(year) for year in range(1984, 1996)]
+    session = make_session(retries=0)
+    with MockSolr(make_docs()) as solr:
+        cells = ke_solr_harvester.count_cells(session, solr.url, TERMS, years)
+        facets = ke_solr_harvester.count_facets(session, solr.url, TERMS, years,
+                                                terms_per_request=2)
+    def canonical(df):
+        return df.astype({'count': int}).sort_values(['mesh', 'year']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(canonical(facets), canonical(cells))
+    assert cells['count'].sum() > 0
+
+
+def test_count_facets_all_years():
+    docs = make_docs()
+    session = make_session(retries=0)
+    with MockSolr(docs) as solr:
+        df = ke_solr_harvester.count_facets(session, solr.url, TERMS)
+    expected = sum(1 for doc in docs if 'PUBLYEAR' in doc and 'HIV-1' in doc['MESH'])
+    assert df[df.mesh == 'HIV-1']['count'].sum() == expected
@@ -0,0 +1,45 @@
+import importlib
+
+from from_qgraph.fetching import make_session
+from mock_solr import MockSolr
+
+reference_to = importlib.import_module('KE-solr_harvester_reference-to')
+
+
+def make_docs():
+    docs = []
+    for i in range(20):
+        # Every DOI is indexed three times
+        for copy in range(3):
+            docs.append({'DOI': [f'10.1/{i}'], 'TITLE': [f'Title {i} ({copy})'],
+                         'PUBLYEAR': 2000 + i, 'PUBLDATE': [f'{2000 + i}-01-01'],
+                         'MESH': ['Humans', f'Term {i}']})
+    return docs
+
+
+def test_lookup_references_pages_through_all_docs():
+    references = [f'10.1/{i}' for i in range(20)] + ['10.1/missing']
+    with MockSolr(make_docs()) as solr:
+        rows, failed = reference_to.lookup_references(make_session(retries=0), solr.url,
+                                                      references, page_size=7)
+        assert len(solr.requests) == 9
+    assert failed == []
+    assert [row[0] for row in rows] == references[:20]
+    assert rows[3] == ('10.1/3', 'Title 3 (0)', 2003, '2003-01-01', 'Humans;Term 3')
+
+
+def test_lookup_references_bisects_failing_batches():
+    references = [f'10.1/{i}' for i in range(20)]
+    with MockSolr(make_docs()) as solr:
+        solr.fail = lambda params: '"10.1/13"' in params['q'][0]
+        rows, failed = reference_to.lookup_references(make_session(retries=0), solr.url, references)
+    assert failed == ['10.1/13']
+    assert [row[0] for row in rows] == references[:13] + references[14:]
+
+
+def test_match_references_any_doi_value():
+    docs = [{'DOI': ['10.1/A', '10.1/B'], 'TITLE': ['First']},
+            {'DOI': ['10.1/b'], 'TITLE': ['Second']},
+            {'DOI': '10.1/C', 'TITLE': 'Third'}]
+    rows = reference_to.match_references(['10.1/b', '10.1/c', '10.1/d'], docs)
+    assert [row[:2] for row in rows] == [('10.1/b', 'First'), ('10.1/c', 'Third')]
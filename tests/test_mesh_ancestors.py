@@ -0,0 +1,34 @@
+import pandas as pd
+
+from mesh_ancestors import MeshAncestors, build_index, save_index
+
+BROADER = {
+    'Betacoronavirus': ['Coronavirus'],
+    'Coronavirus': ['Viruses'],
+    'SARS-CoV-2': ['Betacoronavirus'],
+}
+
+
+def make_index(tmp_path):
+    prefix = str(tmp_path / 'mesh')
+    save_index(prefix, *build_index(BROADER))
+    return MeshAncestors(prefix)
+
+
+def test_expand_annotations_keeps_input_duplicates(tmp_path):
+    ancestors = make_index(tmp_path)
+    df = pd.DataFrame({'paper_id': ['p1', 'p1', 'p1', 'p2'],
+                       'subject': ['SARS-CoV-2', 'SARS-CoV-2', 'Coronavirus', 'Unknown']})
+    expanded = ancestors.expand_annotations(df)
+    # Input rows unchanged, duplicates included
+    pd.testing.assert_frame_equal(expanded.iloc[:4], df)
+    added = expanded.iloc[4:]
+    assert sorted(added.subject) == ['Betacoronavirus', 'Viruses']
+    assert set(added.paper_id) == {'p1'}
+
+
+def test_expand_annotations_without_self(tmp_path):
+    ancestors = make_index(tmp_path)
+    df = pd.DataFrame({'paper_id': ['p1', 'p1'], 'subject': ['SARS-CoV-2', 'Betacoronavirus']})
+    expanded = ancestors.expand_annotations(df, include_self=False)
+    assert sorted(expanded.subject) == ['Betacoronavirus', 'Coronavirus', 'Viruses']